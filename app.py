@@ -1,53 +1,146 @@
 import asyncio
+import contextlib
+import threading
 
-from shiny import App, ui   
-import shinyswatch          
+from shiny import App, ui
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
 
-from continuous_location import update_csv_location
-from continuous_stock import update_csv_stock
-from reactive_server import get_reactive_server_functions
-from reactive_ui_inputs import get_reactive_inputs
-from reactive_ui_outputs import get_reactive_outputs
+from util_config import get_setting
 from util_logger import setup_logger
+from util_metrics import render_metrics
 
 logger, logname = setup_logger(__file__)
 
-async def update_csv_files():
-    while True:
-        logger.info("Calling continuous updates ...")
-        task1 = asyncio.create_task(update_csv_location())
-        task2 = asyncio.create_task(update_csv_stock())
-        await asyncio.gather(task1)
-        await asyncio.gather(task2)
-        await asyncio.sleep(60)  
-
-app_ui = ui.page_navbar(
-    shinyswatch.theme.darkly(),
-     ui.nav(
-        "Data",
-        ui.layout_sidebar(
-            get_reactive_inputs(),
-            get_reactive_outputs(),
-        ),
-    ),
-    ui.nav(ui.a("About", href="https://github.com/Bambee26")),
-    ui.nav(ui.a("GitHub", href="https://github.com/Bambee26/cintel-07-final")),
-    ui.nav(ui.a("App", href="https://bambee26.shinyapps.io/cintel-07-final/")),
-    ui.nav(ui.a("Plotly Express", href="https://plotly.com/python/line-and-scatter/")),
-    ui.nav(ui.a("WeatherAPI", href="https://openweathermap.org/api")),
-    ui.nav(ui.a("OneCallAPI", href="https://openweathermap.org/api/one-call-3")),
-    ui.nav(ui.a("File_Reader", href="https://shiny.rstudio.com/py/api/reactive.file_reader.html")),
-    title=ui.h1("Bambee's Dashboard"),
-)
+# "lazy" starts serving before the data, plotting and widget libraries are
+# imported, then imports them in a background thread at once; "eager"
+# imports everything before the app starts.
+STARTUP_MODE = get_setting("CINTEL_STARTUP_MODE", "lazy")
+
+
+class Dashboard:
+    """The parts of the app that need pandas, plotly and the widget libraries."""
+
+    def __init__(self):
+        import shinyswatch
+
+        import continuous_ingest
+        import continuous_location
+        import continuous_stock
+        from fetch import close_client_session
+        from reactive_server import get_reactive_server_functions
+        from reactive_ui_inputs import get_reactive_inputs
+        from reactive_ui_outputs import get_reactive_outputs
+        from reactive_updates import updates
+
+        self.scheduler = scheduler = continuous_ingest.scheduler
+        self.ingest = continuous_ingest.start
+        self.updates = updates
+        self.server_functions = get_reactive_server_functions
+        self.close_client_session = close_client_session
+
+        # Sessions are told about new rows as soon as a poll has stored them.
+        updates.add("location", continuous_location.store, continuous_location.storage)
+        updates.add("stock", continuous_stock.store, continuous_stock.storage)
+        scheduler.subscribe(updates.publish)
+        updates.listen("location", continuous_location.analytics.refresh)
+        updates.listen("stock", continuous_stock.analytics.refresh)
+
+        self.page = ui.page_navbar(
+            shinyswatch.theme.darkly(),
+             ui.nav(
+                "Data",
+                ui.layout_sidebar(
+                    get_reactive_inputs(),
+                    get_reactive_outputs(),
+                ),
+            ),
+            ui.nav(ui.a("About", href="https://github.com/Bambee26")),
+            ui.nav(ui.a("GitHub", href="https://github.com/Bambee26/cintel-07-final")),
+            ui.nav(ui.a("App", href="https://bambee26.shinyapps.io/cintel-07-final/")),
+            ui.nav(ui.a("Plotly Express", href="https://plotly.com/python/line-and-scatter/")),
+            ui.nav(ui.a("WeatherAPI", href="https://openweathermap.org/api")),
+            ui.nav(ui.a("OneCallAPI", href="https://openweathermap.org/api/one-call-3")),
+            ui.nav(ui.a("File_Reader", href="https://shiny.rstudio.com/py/api/reactive.file_reader.html")),
+            title=ui.h1("Bambee's Dashboard"),
+        )
+
+    def start(self):
+        """Start the continuous updates. It never starts a second copy."""
+        self.updates.start(ingest=self.ingest)
+
+    async def stop(self):
+        await self.scheduler.stop()
+        await self.updates.stop()  # after the pollers, so the next leader starts fresh
+        await self.close_client_session()
+
+
+_dashboard = None
+_dashboard_lock = threading.Lock()
+
+
+def load_dashboard():
+    """Return the Dashboard, importing and building it the first time."""
+    global _dashboard
+    if _dashboard is None:
+        with _dashboard_lock:  # the background import or the first request
+            if _dashboard is None:
+                _dashboard = Dashboard()
+                logger.info("Loaded the dashboard")
+    return _dashboard
+
+
+def app_ui(request):
+    # Waits for the background import if a page is requested during it.
+    return load_dashboard().page
 
 
 def server(input, output, session):
     """Define functions to create UI outputs."""
     logger.info("Starting server ...")
+    dashboard = load_dashboard()
+
+    # Normally already running from app startup; this covers hosts that
+    # do not send ASGI lifespan events.
+    dashboard.start()
+
+    dashboard.server_functions(input, output, session)
+
+
+async def load_in_background():
+    dashboard = await asyncio.to_thread(load_dashboard)
+    dashboard.start()
 
-    asyncio.create_task(update_csv_files())
-    logger.info("Starting continuous updates ...")
 
-    get_reactive_server_functions(input, output, session)
+@contextlib.asynccontextmanager
+async def lifespan(starlette_app):
+    """Start the continuous updates once at app startup; stop them at shutdown."""
+    logger.info(f"Starting continuous updates ({STARTUP_MODE} startup) ...")
+    if STARTUP_MODE == "eager":
+        load_dashboard().start()
+        loading = None
+    else:
+        loading = asyncio.create_task(load_in_background())
+    yield
+    if loading is not None:
+        await loading
+    await load_dashboard().stop()
 
-app = App(app_ui, server, debug=True)
\ No newline at end of file
+
+async def metrics(request):
+    """Serve the hot-path timings and counters in Prometheus text format."""
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+if STARTUP_MODE == "eager":
+    load_dashboard()
+
+shiny_app = App(app_ui, server, debug=True)
+
+app = Starlette(
+    routes=[Route("/metrics", metrics), Mount("/", app=shiny_app)],
+    lifespan=lifespan,
+)
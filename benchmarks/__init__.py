@@ -0,0 +1,7 @@
+"""
+Purpose: Offline benchmarks for the dashboard.
+
+Run each one from the project folder as a module, for example:
+
+    python -m benchmarks.bench_fetch
+"""
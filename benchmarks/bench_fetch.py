@@ -0,0 +1,83 @@
+"""
+Purpose: Show event-loop latency while fetches are in flight.
+
+Runs a batch of concurrent requests against a local stub server twice: once with
+the old blocking urllib call and once with fetch.fetch_from_url. A heartbeat task
+sleeps for a few milliseconds in a loop and records how late it wakes up; a
+blocked event loop shows up as large heartbeat lag.
+
+Usage:
+
+    python -m benchmarks.bench_fetch [--requests 20] [--delay 0.2] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import urllib.request
+
+from benchmarks.report import emit
+from benchmarks.stub_server import StubServer
+from fetch import HttpResponse, close_client_session, fetch_from_url
+
+HEARTBEAT_INTERVAL = 0.005
+
+
+async def blocking_fetch_from_url(url, type="string"):
+    """The previous implementation: urlopen called directly on the event loop."""
+    response = urllib.request.urlopen(url)
+    data = json.loads(response.read().decode("utf-8"))
+    return HttpResponse(response.status, data)
+
+
+async def heartbeat(lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lags.append(time.perf_counter() - start - HEARTBEAT_INTERVAL)
+
+
+async def run_case(fetch, url, num_requests):
+    await fetch(f"{url}/warmup", "json")  # exclude one-time imports and setup
+    lags = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(HEARTBEAT_INTERVAL * 2)
+    start = time.perf_counter()
+    await asyncio.gather(*(fetch(f"{url}/{i}", "json") for i in range(num_requests)))
+    wall = time.perf_counter() - start
+    stop.set()
+    await beat
+    lags.sort()
+    return {
+        "wall_s": round(wall, 4),
+        "loop_lag_max_ms": round(lags[-1] * 1000, 2),
+        "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1] * 1000, 2),
+        "loop_lag_median_ms": round(statistics.median(lags) * 1000, 2),
+    }
+
+
+async def main(num_requests, delay, output=None):
+    results = {}
+    with StubServer(delay=delay) as server:
+        results["blocking_urllib"] = await run_case(
+            blocking_fetch_from_url, server.base_url, num_requests
+        )
+        results["fetch_from_url"] = await run_case(
+            fetch_from_url, server.base_url, num_requests
+        )
+        await close_client_session()
+    results["requests"] = num_requests
+    results["server_delay_s"] = delay
+    return emit("fetch", results, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--delay", type=float, default=0.2)
+    parser.add_argument("--output", help="also write the JSON to this file")
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.delay, args.output))
@@ -0,0 +1,256 @@
+"""
+Purpose: Load-test the whole app offline with many concurrent sessions.
+
+Starts a stub standing in for OpenWeatherMap and Yahoo Finance, then runs
+app:app under uvicorn in a subprocess pointed at the stub, polling every
+--interval seconds with response caching off. For each session count it
+opens that many Shiny websocket sessions at once and keeps them open for
+--duration seconds. Each level reports:
+
+- first_render_s: from opening a session to receiving its first tables
+- ticks_per_session: table updates each session received
+- poll / render: count and mean time of poll cycles and renders, from /metrics
+- rss_per_session_mb: growth of the server's resident memory per session
+- upstream: requests the stub received per API, and per poll
+
+With --capture DIR, the app answers its requests from the responses recorded
+in DIR (CINTEL_REPLAY_MODE=fetch; see continuous_replay) instead of the stub.
+
+Usage:
+
+    python -m benchmarks.bench_load [--sessions 1,10,50] [--duration 10] [--interval 1]
+        [--capture data/captures]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from pathlib import Path
+
+import websockets
+
+from benchmarks.report import ROOT, emit
+from benchmarks.stub_server import StubServer, api_payload
+
+OUTPUTS = [
+    "reactive_location_string",
+    "reactive_location_table",
+    "reactive_location_chart",
+    "reactive_stock_string",
+    "reactive_stock_table",
+    "reactive_stock_chart",
+]
+
+# The sort and paging inputs of each table (see reactive_ui_outputs).
+TABLE_INPUTS = {"SORT": "Time", "ORDER": "desc", "SIZE": "20", "PAGE": 1}
+
+# What a browser sends when a session opens: the inputs and visible outputs.
+INIT_MESSAGE = json.dumps(
+    {
+        "method": "init",
+        "data": {
+            "REACTIVE_LOCATION_SELECT": ["San Diego CA", "Seattle WA"],
+            "REACTIVE_STOCK_SELECT": ["Nordstrom Inc", "NIKE Inc"],
+            **{
+                f"{table}_{name}": value
+                for table in ("REACTIVE_LOCATION_TABLE", "REACTIVE_STOCK_TABLE")
+                for name, value in TABLE_INPUTS.items()
+            },
+            **{f".clientdata_output_{name}_hidden": False for name in OUTPUTS},
+        },
+    }
+)
+
+TABLES = ("reactive_location_table", "reactive_stock_table")
+
+SAMPLE = re.compile(r"^(\w+)(\{.*\})? (\S+)$")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb(pid):
+    with open(f"/proc/{pid}/status") as file:
+        for line in file:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def scrape(port):
+    """Return the /metrics samples as {(name, labels): value}."""
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        text = response.read().decode("utf-8")
+    samples = {}
+    for line in text.splitlines():
+        match = SAMPLE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            samples[(name, labels or "")] = float(value)
+    return samples
+
+
+def total(samples, name, label=""):
+    """Sum the samples called name whose labels contain label."""
+    return sum(v for (n, labels), v in samples.items() if n == name and label in labels)
+
+
+def stage_mean(before, after, stage):
+    label = f'stage="{stage}"'
+    count = total(after, "cintel_stage_seconds_count", label) - total(
+        before, "cintel_stage_seconds_count", label
+    )
+    seconds = total(after, "cintel_stage_seconds_sum", label) - total(
+        before, "cintel_stage_seconds_sum", label
+    )
+    return {"count": int(count), "mean_ms": round(seconds / count * 1000, 3) if count else None}
+
+
+@contextlib.contextmanager
+def run_app(stub_url, interval, workdir, capture=None):
+    """Run app:app in a subprocess (logs go to workdir) and yield (process, port).
+    @param capture: a directory of recorded responses to answer requests from.
+    """
+    port = free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": str(ROOT),
+        "CINTEL_OPENWEATHER_URL": stub_url,
+        "CINTEL_YAHOO_URL": stub_url,
+        "CINTEL_LOCATION_INTERVAL": str(interval),
+        "CINTEL_STOCK_INTERVAL": str(interval),
+        "CINTEL_WEATHER_CACHE_TTL": "0",
+        "CINTEL_STOCK_CACHE_TTL": "0",
+        "CINTEL_STORAGE_BACKEND": "none",
+    }
+    if capture is not None:
+        env["CINTEL_REPLAY_MODE"] = "fetch"
+        env["CINTEL_CAPTURE_DIR"] = str(Path(capture).resolve())
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                scrape(port)
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("The app did not start")
+                time.sleep(0.2)
+        yield process, port
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+async def run_session(url, duration):
+    """One simulated browser session, open for duration seconds."""
+    start = time.perf_counter()
+    first_render = None
+    ticks = 0
+    async with websockets.connect(url, max_size=None) as ws:
+        await ws.send(INIT_MESSAGE)
+        while (remaining := start + duration - time.perf_counter()) > 0:
+            try:
+                message = await asyncio.wait_for(ws.recv(), remaining)
+            except asyncio.TimeoutError:
+                break
+            values = json.loads(message).get("values") or {}
+            if any(name in values for name in TABLES):
+                ticks += 1
+                if first_render is None:
+                    first_render = time.perf_counter() - start
+    return first_render, ticks
+
+
+async def run_level(process, port, stub, sessions, duration):
+    before = scrape(port)
+    upstream_before = dict(stub.api_counts)
+    rss_before = rss_mb(process.pid)
+    url = f"ws://127.0.0.1:{port}/websocket/"
+    tasks = [asyncio.create_task(run_session(url, duration)) for _ in range(sessions)]
+    await asyncio.sleep(max(duration - 1, duration / 2))
+    rss_open = rss_mb(process.pid)  # every session still connected
+    results = await asyncio.gather(*tasks)
+    after = scrape(port)
+
+    first_renders = sorted(first for first, _ in results if first is not None)
+    polls = total(after, "cintel_source_polls_total") - total(
+        before, "cintel_source_polls_total"
+    )
+    upstream = {
+        name: count - upstream_before.get(name, 0)
+        for name, count in stub.api_counts.items()
+    }
+    return {
+        "sessions": sessions,
+        "rendered_sessions": len(first_renders),
+        "first_render_s": {
+            "median": round(statistics.median(first_renders), 4) if first_renders else None,
+            "max": round(first_renders[-1], 4) if first_renders else None,
+        },
+        "ticks_per_session": round(statistics.mean(t for _, t in results), 2),
+        "poll": stage_mean(before, after, "poll"),
+        "render": stage_mean(before, after, "render"),
+        "rss_per_session_mb": round((rss_open - rss_before) / sessions, 3),
+        "polls": int(polls),
+        "upstream": upstream,
+        "upstream_per_poll": round(sum(upstream.values()) / polls, 2) if polls else None,
+    }
+
+
+def main(session_counts, duration, interval, delay, output=None, capture=None):
+    levels = []
+    with tempfile.TemporaryDirectory() as workdir:
+        with StubServer(delay=delay, payload_for=api_payload) as stub:
+            with run_app(stub.base_url, interval, workdir, capture) as (process, port):
+                time.sleep(interval * 2)  # let the stores fill
+                # One session first, so one-time imports are not counted.
+                asyncio.run(run_session(f"ws://127.0.0.1:{port}/websocket/", 2))
+                for sessions in session_counts:
+                    level = asyncio.run(run_level(process, port, stub, sessions, duration))
+                    print(json.dumps(level), file=sys.stderr)
+                    levels.append(level)
+    settings = {"duration_s": duration, "interval_s": interval, "stub_delay_s": delay}
+    if capture is not None:
+        settings["capture"] = str(capture)
+    return emit("load", {**settings, "levels": levels}, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", default="1,10,50")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--output", help="also write the JSON to this file")
+    parser.add_argument("--capture", help="replay the responses recorded in this directory")
+    args = parser.parse_args()
+    main(
+        [int(n) for n in args.sessions.split(",")],
+        args.duration,
+        args.interval,
+        args.delay,
+        args.output,
+        args.capture,
+    )
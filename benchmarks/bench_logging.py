@@ -0,0 +1,126 @@
+"""
+Purpose: Show render latency with logging off, synchronous, and queued.
+
+Runs a representative table render (select rows, build HTML) that logs the
+way the dashboard's hot paths did: several INFO lines per render plus one
+upstream JSON payload. Each mode gets its own logger via util_logger:
+
+- "off": logging disabled.
+- "sync": handlers write to the file and console on the calling thread.
+- "queue": records go to the background listener (CINTEL_LOG_QUEUE).
+
+Console output goes to a sink that discards it. With --slow-io-ms, every
+console write also waits that long, standing in for a slow terminal, a full
+log pipe or a network disk; that is where synchronous logging hurts.
+
+Usage:
+
+    python -m benchmarks.bench_logging [--renders 2000] [--slow-io-ms 1] [--output results.json]
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.report import emit
+import util_logger
+
+PAYLOAD = {
+    "coord": {"lon": -117.1611, "lat": 32.7157},
+    "weather": [{"id": 800, "main": "Clear", "description": "clear sky", "icon": "01d"}],
+    "main": {"temp": 71.3, "feels_like": 71.1, "pressure": 1015, "humidity": 61},
+    "wind": {"speed": 8.05, "deg": 270},
+    "name": "San Diego",
+}
+
+
+class DiscardStream:
+    """A console stream that drops output, optionally after a delay per write."""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def write(self, text):
+        if self.delay:
+            time.sleep(self.delay)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+def make_frame(rows=50):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            "Location": np.resize(["Seattle WA", "San Diego CA"], rows),
+            "Time": pd.date_range("2023-01-01", periods=rows, freq="min"),
+            "Temp_F": 60 + rng.standard_normal(rows),
+        }
+    )
+
+
+def render(logger, df):
+    """One table render, logging as reactive_server used to."""
+    logger.info(f"Data from openweathermap: {PAYLOAD}")
+    logger.info(f"READING df len {len(df)}")
+    selected = df[df["Location"].isin(["San Diego CA"])]
+    logger.info(f"Rendering TEMP table with {len(selected)} rows")
+    html = selected.to_html()
+    logger.info(f"Rendered {len(html)} characters")
+    return html
+
+
+def measure(logger, df, renders):
+    timings = []
+    for _ in range(renders):
+        start = time.perf_counter()
+        render(logger, df)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {
+        "mean_ms": round(statistics.mean(timings) * 1000, 4),
+        "p99_ms": round(timings[int(len(timings) * 0.99) - 1] * 1000, 4),
+    }
+
+
+def main(renders, slow_io_ms, output=None):
+    df = make_frame()
+    results = {}
+    stderr = sys.stderr
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)  # util_logger writes to ./logs
+        sys.stderr = DiscardStream(slow_io_ms / 1000)  # bound by console handlers
+        try:
+            sync_logger, _ = util_logger.setup_logger("bench_sync.py", use_queue=False)
+            queue_logger, _ = util_logger.setup_logger("bench_queue.py", use_queue=True)
+
+            logging.disable(logging.CRITICAL)
+            results["off"] = measure(sync_logger, df, renders)
+            logging.disable(logging.NOTSET)
+            results["sync"] = measure(sync_logger, df, renders)
+            results["queue"] = measure(queue_logger, df, renders)
+            util_logger.stop_logging()
+        finally:
+            sys.stderr = stderr
+            os.chdir(cwd)
+    results["renders"] = renders
+    results["slow_io_ms"] = slow_io_ms
+    return emit("logging", results, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--renders", type=int, default=2000)
+    parser.add_argument("--slow-io-ms", type=float, default=0.0)
+    parser.add_argument("--output", help="also write the JSON to this file")
+    args = parser.parse_args()
+    main(args.renders, args.slow_io_ms, args.output)
@@ -0,0 +1,171 @@
+"""
+Purpose: Compare the memory of the retained window: TimeSeriesStore against a deque of dicts.
+
+The updaters once kept their window as a deque of one dict per row, with a
+Location string and a formatted Time string in every row, and converted the
+whole deque to a DataFrame on every poll. TimeSeriesStore keeps one NumPy
+array per column, entities as integer codes and times as int64 nanoseconds.
+
+For each entity count, --polls polls of one row per entity are retained.
+Each representation reports:
+
+- bytes_per_row: memory held per retained row, measured with tracemalloc
+- append_ms: appending one more poll
+- frame_ms: getting a DataFrame of the window after that poll
+
+frame_zero_copy says whether the store's DataFrame shares its number and
+time columns with the ring buffer instead of copying them.
+
+csv_backend reports what the default storage backend holds in memory
+besides the store (bytes_per_row) after saving the same polls to a
+temporary file, and save_ms for saving one more poll.
+
+Usage:
+
+    python -m benchmarks.bench_memory [--entities 100,1000,5000] [--polls 60]
+"""
+
+import argparse
+import gc
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.report import emit
+from continuous_location import COLUMNS
+from continuous_storage import CsvBackend
+from continuous_store import TimeSeriesStore
+
+START = datetime(2023, 1, 1)
+
+
+def poll_records(entities, names, poll):
+    """One poll's records, built the way update_csv_location builds them."""
+    time_now = (START + timedelta(minutes=poll)).strftime("%Y-%m-%d %H:%M:%S")
+    rng = np.random.default_rng(poll)
+    temps = np.round(60 + rng.standard_normal(entities) * 10, 2).tolist()
+    return [
+        {
+            "Location": names[i],
+            "Latitude": 40.0 + i / entities,
+            "Longitude": -120.0 - i / entities,
+            "Time": time_now,
+            "Temp_F": temps[i],
+        }
+        for i in range(entities)
+    ]
+
+
+def traced(build):
+    """Return (what build() returns, bytes it still holds), via tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return result, held
+
+
+def timed_ms(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, round((time.perf_counter() - start) * 1000, 3)
+
+
+def bench_deque(entities, polls, names):
+    rows = entities * polls
+
+    def build():
+        window = deque(maxlen=rows)
+        for poll in range(polls):
+            window.extend(poll_records(entities, names, poll))
+        return window
+
+    window, held = traced(build)
+    records = poll_records(entities, names, polls)
+    _, append_ms = timed_ms(lambda: window.extend(records))
+    _, frame_ms = timed_ms(lambda: pd.DataFrame(window))
+    return {"bytes_per_row": round(held / rows, 1), "append_ms": append_ms, "frame_ms": frame_ms}
+
+
+def bench_store(entities, polls, names):
+    rows = entities * polls
+
+    def build():
+        store = TimeSeriesStore(COLUMNS, capacity=rows)
+        for poll in range(polls):
+            store.append(poll_records(entities, names, poll))
+        return store
+
+    store, held = traced(build)
+    records = poll_records(entities, names, polls)
+    _, append_ms = timed_ms(lambda: store.append(records))
+    df, frame_ms = timed_ms(store.frame)
+    zero_copy = all(
+        np.shares_memory(df[name].to_numpy(), store.view(name))
+        for name, kind in COLUMNS.items()
+        if kind != "category"
+    )
+    return {
+        "bytes_per_row": round(held / rows, 1),
+        "buffer_bytes_per_row": round(store.nbytes / rows, 1),
+        "append_ms": append_ms,
+        "frame_ms": frame_ms,
+        "frame_zero_copy": zero_copy,
+    }
+
+
+def bench_csv_backend(entities, polls, names):
+    rows = entities * polls
+    with tempfile.TemporaryDirectory() as tmp:
+
+        def build():
+            backend = CsvBackend(Path(tmp).joinpath("memory"), COLUMNS, rows)
+            for poll in range(polls):
+                backend.save(poll_records(entities, names, poll))
+            return backend
+
+        backend, held = traced(build)
+        records = poll_records(entities, names, polls)
+        _, save_ms = timed_ms(lambda: backend.save(records))
+    return {"bytes_per_row": round(held / rows, 1), "save_ms": save_ms}
+
+
+def main(entity_counts, polls, output=None):
+    levels = []
+    for entities in entity_counts:
+        # One string object per entity, as the registry hands out.
+        names = [f"Location {i:05d}" for i in range(entities)]
+        dicts = bench_deque(entities, polls, names)
+        store = bench_store(entities, polls, names)
+        csv_backend = bench_csv_backend(entities, polls, names)
+        levels.append(
+            {
+                "entities": entities,
+                "rows": entities * polls,
+                "deque_of_dicts": dicts,
+                "store": store,
+                "csv_backend": csv_backend,
+                "memory_ratio": round(dicts["bytes_per_row"] / store["bytes_per_row"], 1),
+            }
+        )
+    return emit("memory", {"polls": polls, "levels": levels}, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entities", default="100,1000,5000")
+    parser.add_argument("--polls", type=int, default=60)
+    parser.add_argument("--output", help="also write the JSON to this file")
+    args = parser.parse_args()
+    main([int(n) for n in args.entities.split(",")], args.polls, args.output)
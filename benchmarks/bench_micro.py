@@ -0,0 +1,281 @@
+"""
+Purpose: Time the individual hot paths, each in isolation.
+
+- fetch: fetch_from_url against a local stub, one at a time and concurrently
+- csv_append / csv_read: IncrementalCsvWriter.append and read_csv_typed
+- store_frame / store_select: rebuilding the shared DataFrame after a tick,
+  and the per-selection rows the table and chart use
+- chart_incremental / chart_full: updating the FigureWidget in place after a
+  tick, against building a px.line figure from scratch
+- analytics_incremental / analytics_full: RollingAnalytics.refresh after a
+  tick, against pandas rolling statistics over the whole history
+- table_page / table_full: the HTML of one sorted page of the selection after
+  a tick, against the HTML of the whole selection
+- render_shared / render_per_session: the table page, analytics table and
+  chart lines of SESSIONS sessions with the same selection after a tick,
+  through one RenderCache, against each session building its own
+
+Every case is measured on a history of --rows rows (five locations).
+
+Usage:
+
+    python -m benchmarks.bench_micro [--rows 10000] [--repeat 200]
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import plotly.express as px
+
+from benchmarks.report import emit
+from benchmarks.stub_server import StubServer, api_payload
+from continuous_analytics import RollingAnalytics
+from continuous_location import COLUMNS
+from continuous_storage import IncrementalCsvWriter, read_csv_typed
+from continuous_store import TimeSeriesStore
+from fetch import close_client_session, fetch_from_url
+from reactive_charts import IncrementalLineChart
+from reactive_tables import PAGE_SIZE, page, render_page, table_html
+from util_cache import RenderCache
+from util_downsample import downsample_groups
+
+LOCATIONS = ["Seattle WA", "Portland OR", "San Francisco CA", "San Diego CA", "Phoenix AZ"]
+SELECTED = ["San Diego CA", "Seattle WA"]
+START = datetime(2023, 1, 1)
+
+# Sessions looking at the same selection, for bench_render_cache.
+SESSIONS = 20
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        "mean_ms": round(statistics.mean(timings) * 1000, 4),
+        "p99_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000, 4),
+    }
+
+
+def measure(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return summarize(timings)
+
+
+class Ticks:
+    """Synthetic temperature records, one record per location per tick."""
+
+    def __init__(self):
+        self.tick = 0
+        self.rng = np.random.default_rng(0)
+
+    def next(self):
+        time_now = (START + timedelta(seconds=self.tick)).strftime("%Y-%m-%d %H:%M:%S")
+        self.tick += 1
+        return [
+            {
+                "Location": location,
+                "Latitude": 40.0 + i,
+                "Longitude": -120.0 + i,
+                "Time": time_now,
+                "Temp_F": round(60 + float(self.rng.standard_normal()) * 10, 2),
+            }
+            for i, location in enumerate(LOCATIONS)
+        ]
+
+    def history(self, rows):
+        records = []
+        while len(records) < rows:
+            records.extend(self.next())
+        return records[-rows:]
+
+
+async def bench_fetch(repeat):
+    with StubServer(payload_for=api_payload) as server:
+        url = f"{server.base_url}/data/2.5/weather?lat=1&lon=2"
+        await fetch_from_url(url, "json")  # open the connection pool
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            await fetch_from_url(url, "json")
+            timings.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        await asyncio.gather(*(fetch_from_url(url, "json") for _ in range(repeat)))
+        concurrent_s = time.perf_counter() - start
+        await close_client_session()
+    return {
+        "sequential": summarize(timings),
+        "concurrent": {
+            "requests": repeat,
+            "per_request_ms": round(concurrent_s / repeat * 1000, 4),
+        },
+    }
+
+
+def bench_csv(rows, repeat, tmp):
+    ticks = Ticks()
+    path = Path(tmp).joinpath("location.csv")
+    writer = IncrementalCsvWriter(path, COLUMNS, max_rows=rows)
+    writer.append(ticks.history(rows))
+    return {
+        "csv_append": measure(lambda: writer.append(ticks.next()), repeat),
+        "csv_read": measure(lambda: read_csv_typed(path, COLUMNS, rows), max(1, repeat // 10)),
+    }
+
+
+def bench_store(rows, repeat):
+    ticks = Ticks()
+    store = TimeSeriesStore(COLUMNS, capacity=rows)
+    store.append(ticks.history(rows))
+
+    def tick_and_frame():
+        store.append(ticks.next())
+        store.frame()
+
+    def tick_and_select():
+        store.append(ticks.next())
+        store.select("Location", SELECTED)
+
+    return {
+        "store_frame": measure(tick_and_frame, repeat),
+        "store_select": measure(tick_and_select, repeat),
+    }
+
+
+def bench_charts(rows, repeat):
+    ticks = Ticks()
+    store = TimeSeriesStore(COLUMNS, capacity=rows)
+    store.append(ticks.history(rows))
+    chart = IncrementalLineChart("Location", "Temp_F", "Temperature", max_points=500)
+    chart.update(store.select("Location", SELECTED), SELECTED)
+
+    def incremental():
+        store.append(ticks.next())
+        chart.update(store.select("Location", SELECTED), SELECTED)
+
+    def full():
+        store.append(ticks.next())
+        df = downsample_groups(
+            store.select("Location", SELECTED), "Location", "Time", "Temp_F", 500, "lttb"
+        )
+        px.line(df, x="Time", y="Temp_F", color="Location", markers=True)
+
+    return {
+        "chart_incremental": measure(incremental, repeat),
+        "chart_full": measure(full, max(1, repeat // 10)),
+    }
+
+
+def bench_analytics(rows, repeat):
+    ticks = Ticks()
+    store = TimeSeriesStore(COLUMNS, capacity=rows)
+    store.append(ticks.history(rows))
+    analytics = RollingAnalytics("Location", "Temp_F")
+    analytics.refresh(store)
+
+    def incremental():
+        store.append(ticks.next())
+        analytics.refresh(store)
+        analytics.snapshot(SELECTED)
+
+    def full():
+        store.append(ticks.next())
+        values = store.frame().groupby("Location", observed=True)["Temp_F"]
+        values.rolling(10).mean()
+        values.rolling(10).std()
+        values.pct_change(5)
+
+    return {
+        "analytics_incremental": measure(incremental, repeat),
+        "analytics_full": measure(full, max(1, repeat // 10)),
+    }
+
+
+def bench_tables(rows, repeat):
+    ticks = Ticks()
+    store = TimeSeriesStore(COLUMNS, capacity=rows)
+    store.append(ticks.history(rows))
+
+    def paged():
+        store.append(ticks.next())
+        rows, _, _ = page(store.select("Location", SELECTED), "Time", True, 1, PAGE_SIZE)
+        rows.to_html()
+
+    def full():
+        store.append(ticks.next())
+        store.select("Location", SELECTED).to_html()
+
+    return {
+        "table_page": measure(paged, repeat),
+        "table_full": measure(full, max(1, repeat // 10)),
+    }
+
+
+def bench_render_cache(rows, repeat):
+    ticks = Ticks()
+    store = TimeSeriesStore(COLUMNS, capacity=rows)
+    store.append(ticks.history(rows))
+    analytics = RollingAnalytics("Location", "Temp_F")
+    cache = RenderCache("bench", max_size=256)
+
+    def render_table():
+        return render_page(store.select("Location", SELECTED), "Time", True, 1, PAGE_SIZE)
+
+    def render_analytics():
+        return table_html(analytics.snapshot(SELECTED))
+
+    def render_lines():
+        df = store.select("Location", SELECTED)
+        return downsample_groups(df, "Location", "Time", "Temp_F", 500, "lttb")
+
+    renders = {"page": render_table, "analytics": render_analytics, "lines": render_lines}
+
+    def shared():
+        store.append(ticks.next())
+        analytics.refresh(store)
+        view = (store.version, tuple(sorted(SELECTED)))
+        for _ in range(SESSIONS):
+            for name, render in renders.items():
+                cache.get((name, view), render)
+
+    def per_session():
+        store.append(ticks.next())
+        analytics.refresh(store)
+        for _ in range(SESSIONS):
+            for render in renders.values():
+                render()
+
+    return {
+        "render_shared": measure(shared, max(1, repeat // 10)),
+        "render_per_session": measure(per_session, max(1, repeat // 10)),
+    }
+
+
+def main(rows, repeat, output=None):
+    results = {"rows": rows, "repeat": repeat}
+    results["fetch"] = asyncio.run(bench_fetch(repeat))
+    with tempfile.TemporaryDirectory() as tmp:
+        results.update(bench_csv(rows, repeat, tmp))
+    results.update(bench_store(rows, repeat))
+    results.update(bench_charts(rows, repeat))
+    results.update(bench_analytics(rows, repeat))
+    results.update(bench_tables(rows, repeat))
+    results.update(bench_render_cache(rows, repeat))
+    return emit("micro", results, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--output", help="also write the JSON to this file")
+    args = parser.parse_args()
+    main(args.rows, args.repeat, args.output)
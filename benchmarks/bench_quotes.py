@@ -0,0 +1,68 @@
+"""
+Purpose: Compare per-ticker and batched stock price fetching.
+
+For each ticker count, fetches every price once per mode from a local stub
+that answers like Yahoo Finance (an options-chain document per ticker, or one
+multi-symbol quote document per request) and reports the requests made, the
+response bytes received and the wall time of the cycle.
+
+Usage:
+
+    python -m benchmarks.bench_quotes [--tickers 5,100,500] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import time
+
+import continuous_stock
+from benchmarks.report import emit
+from benchmarks.stub_server import StubServer, api_payload
+from continuous_batch import fetch_batch
+from fetch import close_client_session
+
+
+async def fetch_single(tickers):
+    batch = await fetch_batch(tickers, continuous_stock.fetch_stock_price)
+    return batch.results
+
+
+async def run_case(server, fetch, tickers):
+    requests, bytes_sent = server.request_count, server.bytes_sent
+    start = time.perf_counter()
+    prices = await fetch(tickers)
+    wall = time.perf_counter() - start
+    return {
+        "prices": len(prices),
+        "requests": server.request_count - requests,
+        "kilobytes": round((server.bytes_sent - bytes_sent) / 1024, 1),
+        "wall_s": round(wall, 4),
+    }
+
+
+async def main(ticker_counts, delay, output=None):
+    results = []
+    with StubServer(delay=delay, payload_for=api_payload) as server:
+        continuous_stock.YAHOO_URL = server.base_url
+        for count in ticker_counts:
+            tickers = [f"T{i:04d}" for i in range(count)]
+            results.append(
+                {
+                    "tickers": count,
+                    "single": await run_case(server, fetch_single, tickers),
+                    "batch": await run_case(
+                        server, continuous_stock.fetch_stock_prices, tickers
+                    ),
+                }
+            )
+        await close_client_session()
+    return emit("quotes", {"stub_delay_s": delay, "cases": results}, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tickers", default="5,100,500")
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--output", help="also write the JSON to this file")
+    args = parser.parse_args()
+    asyncio.run(main([int(n) for n in args.tickers.split(",")], args.delay, args.output))
@@ -0,0 +1,162 @@
+"""
+Purpose: Measure cold start and hold `import app` to an import-time budget.
+
+For each startup mode (CINTEL_STARTUP_MODE lazy and eager) it reports:
+
+- import_ms: `import app` in a fresh interpreter (median of --repeat runs),
+  from python -X importtime
+- modules: the import cost of each project module (self and cumulative)
+  and of the --top most expensive libraries (self time summed per package)
+- listening_s: from starting uvicorn until /metrics answers
+- first_page_s: from starting uvicorn until the dashboard page is served
+
+The lazy mode's import_ms is checked against --budget-ms; the exit status is
+1 if it is over budget.
+
+Usage:
+
+    python -m benchmarks.bench_startup [--repeat 5] [--budget-ms 600]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from collections import defaultdict
+
+from benchmarks.report import ROOT, emit
+
+MODES = ("lazy", "eager")
+
+PROJECT_MODULES = {path.stem for path in ROOT.glob("*.py")}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def environment(mode):
+    return {
+        **os.environ,
+        "PYTHONPATH": str(ROOT),
+        "CINTEL_STARTUP_MODE": mode,
+        "CINTEL_STORAGE_BACKEND": "none",
+    }
+
+
+def import_times(mode, workdir):
+    """Import app once in a fresh interpreter.
+    @returns: {module: (self_us, cumulative_us)}, in import order.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=workdir,
+        env=environment(mode),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def summarize(runs, top):
+    """Median import cost per project module and per top library package."""
+    project = defaultdict(lambda: ([], []))
+    libraries = defaultdict(list)
+    for times in runs:
+        by_package = defaultdict(int)
+        for name, (self_us, cumulative_us) in times.items():
+            package = name.split(".")[0]
+            if package in PROJECT_MODULES:
+                project[name][0].append(self_us)
+                project[name][1].append(cumulative_us)
+            else:
+                by_package[package] += self_us
+        for package, self_us in by_package.items():
+            libraries[package].append(self_us)
+
+    def ms(values):
+        return round(statistics.median(values) / 1000, 1)
+
+    modules = {
+        name: {"self_ms": ms(self_us), "cumulative_ms": ms(cumulative_us)}
+        for name, (self_us, cumulative_us) in project.items()
+    }
+    costly = sorted(libraries.items(), key=lambda item: -statistics.median(item[1]))
+    return modules, {package: ms(values) for package, values in costly[:top]}
+
+
+def serve_times(mode, workdir):
+    """Start uvicorn; return seconds until /metrics and until / answer."""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=workdir,
+        env=environment(mode),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        listening = None
+        deadline = start + 60
+        while listening is None:
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics").read()
+                listening = time.perf_counter() - start
+            except OSError:
+                if process.poll() is not None or time.perf_counter() > deadline:
+                    raise RuntimeError("The app did not start")
+                time.sleep(0.01)
+        urllib.request.urlopen(f"http://127.0.0.1:{port}/").read()
+        first_page = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+    return round(listening, 3), round(first_page, 3)
+
+
+def main(repeat, top, budget_ms, output=None):
+    results = {"budget_ms": budget_ms, "modes": {}}
+    with tempfile.TemporaryDirectory() as workdir:
+        for mode in MODES:
+            runs = [import_times(mode, workdir) for _ in range(repeat)]
+            modules, libraries = summarize(runs, top)
+            serves = [serve_times(mode, workdir) for _ in range(repeat)]
+            results["modes"][mode] = {
+                "import_ms": round(statistics.median(r["app"][1] for r in runs) / 1000, 1),
+                "listening_s": statistics.median(s[0] for s in serves),
+                "first_page_s": statistics.median(s[1] for s in serves),
+                "modules": modules,
+                "libraries": libraries,
+            }
+    import_ms = results["modes"]["lazy"]["import_ms"]
+    results["within_budget"] = import_ms <= budget_ms
+    emit("startup", results, output)
+    if not results["within_budget"]:
+        print(f"import app took {import_ms} ms; the budget is {budget_ms} ms", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="libraries to list")
+    parser.add_argument("--budget-ms", type=float, default=600.0)
+    parser.add_argument("--output", help="also write the JSON to this file")
+    args = parser.parse_args()
+    main(args.repeat, args.top, args.budget_ms, args.output)
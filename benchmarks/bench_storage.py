@@ -0,0 +1,112 @@
+"""
+Purpose: Compare load time and memory of the storage backends.
+
+For each size, writes a synthetic temperature history with every backend, then
+loads it back in a fresh subprocess (so memory is measured cleanly) and
+reports the load time and the growth of the resident set size (RSS). Loading
+includes one pass over the value column, so lazily mapped data is counted.
+
+Usage:
+
+    python -m benchmarks.bench_storage [--sizes 10000,1000000,10000000] [--output results.json]
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.report import emit
+from continuous_location import COLUMNS
+from continuous_storage import make_backend
+
+BACKENDS = ("csv", "parquet", "mmap")
+LOCATIONS = ["Seattle WA", "Portland OR", "San Francisco CA", "San Diego CA", "Phoenix AZ"]
+
+
+def synthetic_frame(rows):
+    rng = np.random.default_rng(0)
+    location = np.resize(np.arange(len(LOCATIONS)), rows)
+    return pd.DataFrame(
+        {
+            "Location": pd.Categorical.from_codes(location, categories=LOCATIONS),
+            "Latitude": 40.0 + location,
+            "Longitude": -120.0 + location,
+            "Time": pd.date_range("2023-01-01", periods=rows, freq="s"),
+            "Temp_F": 60 + rng.standard_normal(rows) * 10,
+        }
+    )
+
+
+def rss_mb():
+    """Current resident set size in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def load_once(kind, base_path, rows):
+    """Run in the subprocess: load one backend and report time and RSS."""
+    before = rss_mb()
+    start = time.perf_counter()
+    df = make_backend(kind, base_path, COLUMNS, rows).load()
+    float(df["Temp_F"].mean())
+    elapsed = time.perf_counter() - start
+    assert len(df) == rows
+    print(json.dumps({"load_s": round(elapsed, 4), "rss_mb": round(rss_mb() - before, 1)}))
+
+
+def run(sizes, output=None):
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            df = synthetic_frame(rows)
+            for kind in BACKENDS:
+                base_path = Path(tmp).joinpath(f"{kind}_{rows}")
+                try:
+                    backend = make_backend(kind, base_path, COLUMNS, rows)
+                except ImportError as e:
+                    results.append({"backend": kind, "rows": rows, "skipped": str(e)})
+                    continue
+                start = time.perf_counter()
+                backend.write_frame(df)
+                write_s = time.perf_counter() - start
+                child = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.bench_storage",
+                     "--load", kind, str(base_path), str(rows)],
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+                measured = json.loads(child.stdout.strip().splitlines()[-1])
+                results.append(
+                    {"backend": kind, "rows": rows, "write_s": round(write_s, 4), **measured}
+                )
+                print(json.dumps(results[-1]), file=sys.stderr)
+    return emit("storage", results, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10000,1000000,10000000")
+    parser.add_argument("--output", help="also write the JSON to this file")
+    parser.add_argument("--load", nargs=3, metavar=("BACKEND", "PATH", "ROWS"))
+    args = parser.parse_args()
+    if args.load:
+        kind, base_path, rows = args.load
+        load_once(kind, base_path, int(rows))
+    else:
+        run([int(size) for size in args.sizes.split(",")], args.output)
@@ -0,0 +1,88 @@
+"""
+Purpose: Compare per-location and bulk weather fetching.
+
+For each location count, builds synthetic locations (every fourth one in the
+same grid cell as its neighbour, the rest with city ids) and fetches every
+temperature once per mode from a local stub that answers like
+OpenWeatherMap. Reports the requests made and the wall time of the cycle.
+
+Usage:
+
+    python -m benchmarks.bench_weather [--locations 5,100,500] [--output results.json]
+"""
+
+import argparse
+import asyncio
+import time
+
+import continuous_location
+from benchmarks.report import emit
+from benchmarks.stub_server import StubServer, api_payload
+from continuous_batch import fetch_batch
+from fetch import close_client_session
+from util_entities import Location
+
+
+def synthetic_locations(count):
+    locations = []
+    for i in range(count):
+        lat = -60.0 + (i // 4) % 240 * 0.5
+        long = -170.0 + (i // 960) * 2.0 + (i % 4) * 0.5
+        if i % 4 == 3:
+            long = locations[-1].longitude + 0.001  # same cell as its neighbour
+        locations.append(Location(f"City {i}", lat, long, city_id=1000 + i))
+    return locations
+
+
+async def fetch_single(locations):
+    async def fetch_one(location):
+        return await continuous_location.fetch_temperature_from_openweathermap(
+            location.latitude, location.longitude
+        )
+
+    batch = await fetch_batch(locations, fetch_one)
+    return batch.results
+
+
+async def fetch_bulk(locations):
+    continuous_location.weather_cache.clear()
+    temps, _ = await continuous_location.get_temperatures(locations)
+    return temps
+
+
+async def run_case(server, fetch, locations):
+    requests = server.request_count
+    start = time.perf_counter()
+    temps = await fetch(locations)
+    wall = time.perf_counter() - start
+    return {
+        "temperatures": len(temps),
+        "requests": server.request_count - requests,
+        "wall_s": round(wall, 4),
+    }
+
+
+async def main(location_counts, delay, output=None):
+    results = []
+    with StubServer(delay=delay, payload_for=api_payload) as server:
+        continuous_location.OPENWEATHER_URL = server.base_url
+        for count in location_counts:
+            locations = synthetic_locations(count)
+            results.append(
+                {
+                    "locations": count,
+                    "single": await run_case(server, fetch_single, locations),
+                    "bulk": await run_case(server, fetch_bulk, locations),
+                }
+            )
+        await close_client_session()
+    return emit("weather", {"stub_delay_s": delay, "cases": results}, output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--locations", default="5,100,500")
+    parser.add_argument("--delay", type=float, default=0.05)
+    parser.add_argument("--output", help="also write the JSON to this file")
+    args = parser.parse_args()
+    asyncio.run(main([int(n) for n in args.locations.split(",")], args.delay, args.output))
@@ -0,0 +1,34 @@
+"""
+Purpose: Emit benchmark results as JSON, tagged with the commit they ran on.
+"""
+
+import json
+import subprocess
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def emit(name, results, output=None):
+    """Print results as JSON and, if output is given, also write them there."""
+    document = {"benchmark": name, "commit": git_commit(), "results": results}
+    text = json.dumps(document, indent=2)
+    print(text)
+    if output:
+        Path(output).write_text(text + "\n")
+    return document
@@ -0,0 +1,129 @@
+"""
+Purpose: Provide a local stub HTTP server for offline benchmarks.
+
+The stub answers every GET with a small JSON document after an optional delay,
+so benchmarks can exercise real sockets without touching the internet.
+api_payload() answers like OpenWeatherMap and Yahoo Finance, so the app
+itself can be pointed at the stub (CINTEL_OPENWEATHER_URL, CINTEL_YAHOO_URL).
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def api_name(path):
+    """Return which upstream API a request path belongs to."""
+    if path.startswith("/data/2.5/"):
+        return "openweathermap"
+    if path.startswith("/v7/finance/"):
+        return "yahoo"
+    return "other"
+
+
+def temperature():
+    return round(random.uniform(40.0, 90.0), 2)
+
+
+def price():
+    return round(random.uniform(20.0, 200.0), 2)
+
+
+def options_chain(symbol, contracts=100):
+    """An options-chain document about the size of Yahoo's, for one symbol."""
+    options = [
+        {
+            "contractSymbol": f"{symbol}230120C{strike:08d}",
+            "strike": strike / 1000,
+            "lastPrice": price(),
+            "bid": price(),
+            "ask": price(),
+            "volume": random.randint(0, 5000),
+            "openInterest": random.randint(0, 50000),
+            "impliedVolatility": random.random(),
+            "inTheMoney": random.random() < 0.5,
+        }
+        for strike in range(50000, 50000 + contracts * 2500, 2500)
+    ]
+    return {
+        "optionChain": {
+            "result": [
+                {
+                    "underlyingSymbol": symbol,
+                    "quote": {"symbol": symbol, "regularMarketPrice": price()},
+                    "options": [{"calls": options, "puts": options}],
+                }
+            ]
+        }
+    }
+
+
+def api_payload(path):
+    """Return a response in the shape of the API path belongs to."""
+    name = api_name(path)
+    if name == "openweathermap":
+        url = urlsplit(path)
+        if url.path == "/data/2.5/group":
+            ids = parse_qs(url.query)["id"][0].split(",")
+            cities = [{"id": int(i), "main": {"temp": temperature()}} for i in ids]
+            return {"cnt": len(cities), "list": cities}
+        return {"main": {"temp": temperature()}}
+    if name == "yahoo":
+        url = urlsplit(path)
+        if url.path == "/v7/finance/quote":
+            symbols = parse_qs(url.query)["symbols"][0].split(",")
+            quotes = [{"symbol": s, "regularMarketPrice": price()} for s in symbols]
+            return {"quoteResponse": {"result": quotes, "error": None}}
+        return options_chain(url.path.rsplit("/", 1)[-1])
+    return {"path": path}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real APIs
+    disable_nagle_algorithm = True  # no delayed-ACK stall between header and body
+
+    def do_GET(self):
+        self.server.request_count += 1
+        self.server.api_counts[api_name(self.path)] += 1
+        time.sleep(self.server.delay)
+        body = json.dumps(self.server.payload_for(self.path)).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.server.bytes_sent += len(body)
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # many simultaneous connects must not be dropped
+
+    def __init__(self, delay=0.0, payload_for=None):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.delay = delay
+        self.request_count = 0
+        self.api_counts = Counter()  # requests per api_name()
+        self.bytes_sent = 0  # response bodies only
+        self.payload_for = payload_for or (lambda path: {"path": path})
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,218 @@
+"""
+Purpose: Compute rolling statistics and alerts on the live data as it arrives.
+
+One RollingAnalytics per source (weather, stocks) keeps, for every entity,
+the most recent values and times in a NumPy ring buffer (one row of a 2D
+array per entity) with running sums. Each new point updates its entity in
+O(1) work, vectorized over the entities in a poll, and nothing is ever
+recomputed over the full history. Per entity it reports:
+
+- the rolling mean and standard deviation of the last CINTEL_ROLLING_WINDOW points
+- the percent change over the last CINTEL_CHANGE_MINUTES minutes
+- the z-score of the newest point against the window before it; an alert
+  when its size reaches CINTEL_ZSCORE_ALERT
+- an alert when the newest value is below or above the entity's alert_low or
+  alert_high, if set in data/entities.json
+
+refresh(store) takes the rows added to a TimeSeriesStore since the last call.
+Rows are found by time, so it works the same in a process that polls and in
+one that reloads the store from data/ (see reactive_updates). Rows that have
+the same time as the newest row already seen are treated as seen.
+"""
+
+import numpy as np
+import pandas as pd
+
+from util_config import get_setting
+from util_logger import setup_logger
+from util_metrics import timed
+
+logger, log_filename = setup_logger(__file__)
+
+ROLLING_WINDOW = get_setting("CINTEL_ROLLING_WINDOW", 10, int)
+CHANGE_MINUTES = get_setting("CINTEL_CHANGE_MINUTES", 5, float)
+ZSCORE_ALERT = get_setting("CINTEL_ZSCORE_ALERT", 3.0, float)
+
+# Points kept per entity; enough to look CHANGE_MINUTES back at a poll a second.
+HISTORY = 512
+
+# Points in the window before a z-score is reported.
+MIN_POINTS = 3
+
+# Rows of the state arrays added at a time as entities appear.
+GROW_BY = 16
+
+
+class RollingAnalytics:
+    """Rolling statistics and alerts for every entity of one source."""
+
+    def __init__(
+        self,
+        entity_column,
+        value_column,
+        window=ROLLING_WINDOW,
+        change_minutes=CHANGE_MINUTES,
+        zscore_alert=ZSCORE_ALERT,
+        thresholds=None,
+        history=HISTORY,
+    ):
+        """
+        @param entity_column: the category column naming the entity, e.g. "Location".
+        @param value_column: the float column to analyse, e.g. "Temp_F".
+        @param window: points in the rolling mean and standard deviation.
+        @param thresholds: dict of entity name to (low, high) alert limits;
+        either limit may be None.
+        @param history: points kept per entity; at least window.
+        """
+        if window > history:
+            raise ValueError(f"The window ({window}) cannot exceed the history ({history})")
+        self.entity_column = entity_column
+        self.value_column = value_column
+        self.window = window
+        self.change_ns = int(change_minutes * 60 * 1e9)
+        self.change_minutes = change_minutes
+        self.zscore_alert = zscore_alert
+        self.thresholds = dict(thresholds or {})
+        self.history = history
+        self._rows = {}  # entity name -> row of the state arrays
+        self._names = []
+        self._times = np.zeros((0, history), dtype=np.int64)
+        self._values = np.zeros((0, history), dtype=np.float64)
+        self._count = np.zeros(0, dtype=np.int64)  # points seen per entity
+        self._sum = np.zeros(0, dtype=np.float64)  # of the last `window` values
+        self._sumsq = np.zeros(0, dtype=np.float64)
+        self._zscore = np.zeros(0, dtype=np.float64)  # of each entity's newest point
+        self._alerts = {}  # entity name -> alert text, while alerting
+        self._last_time = None  # newest time consumed from a store
+        self._version = None  # store version consumed
+
+    def _row(self, name):
+        row = self._rows.get(name)
+        if row is None:
+            row = self._rows[name] = len(self._names)
+            self._names.append(name)
+            if row == len(self._count):
+                self._grow()
+        return row
+
+    def _grow(self):
+        self._times = np.vstack([self._times, np.zeros((GROW_BY, self.history), np.int64)])
+        self._values = np.vstack([self._values, np.zeros((GROW_BY, self.history))])
+        self._count = np.append(self._count, np.zeros(GROW_BY, np.int64))
+        self._sum = np.append(self._sum, np.zeros(GROW_BY))
+        self._sumsq = np.append(self._sumsq, np.zeros(GROW_BY))
+        self._zscore = np.append(self._zscore, np.full(GROW_BY, np.nan))
+
+    def refresh(self, store):
+        """Take in the rows added to store since the last refresh."""
+        if store.version == self._version:
+            return
+        self._version = store.version
+        times = store.view("Time")
+        start = 0
+        if self._last_time is not None:
+            start = int(np.searchsorted(times, self._last_time, side="right"))
+        if start >= len(times):
+            return
+        categories = store.categories(self.entity_column)
+        lookup = np.array([self._row(name) for name in categories], dtype=np.int64)
+        rows = lookup[store.view(self.entity_column)[start:]]
+        self.extend(rows, times[start:], store.view(self.value_column)[start:])
+        self._last_time = int(times[-1])
+
+    @timed("analytics")
+    def extend(self, rows, times, values):
+        """Add points (arrays of state rows, ns times and values), oldest first."""
+        # Each pass updates every entity at most once, so it can be vectorized.
+        passes = pd.Series(rows).groupby(rows).cumcount().to_numpy()
+        for n in range(int(passes.max()) + 1 if len(passes) else 0):
+            mask = passes == n
+            self._add(rows[mask], times[mask], values[mask])
+        self._check_alerts(np.unique(rows))
+
+    def _add(self, rows, times, values):
+        count = self._count[rows]
+        window = self.window
+        # The z-score of each new point against the window before it.
+        k = np.minimum(count, window)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self._sum[rows] / k
+            std = np.sqrt(np.maximum(self._sumsq[rows] / k - mean * mean, 0.0))
+            zscore = (values - mean) / std
+        self._zscore[rows] = np.where((k >= MIN_POINTS) & (std > 0), zscore, np.nan)
+        # The point leaving the window, once it is full.
+        full = count >= window
+        leaving = self._values[rows, (count - window) % self.history]
+        self._sum[rows] -= np.where(full, leaving, 0.0)
+        self._sumsq[rows] -= np.where(full, leaving * leaving, 0.0)
+        positions = count % self.history
+        self._values[rows, positions] = values
+        self._times[rows, positions] = times
+        self._sum[rows] += values
+        self._sumsq[rows] += values * values
+        self._count[rows] = count + 1
+
+    def _latest(self, row):
+        return self._values[row, (self._count[row] - 1) % self.history]
+
+    def _check_alerts(self, rows):
+        for row in rows:
+            name = self._names[row]
+            reasons = []
+            zscore = self._zscore[row]
+            if not np.isnan(zscore) and abs(zscore) >= self.zscore_alert:
+                reasons.append(f"z-score {zscore:+.1f}")
+            low, high = self.thresholds.get(name, (None, None))
+            value = self._latest(row)
+            if low is not None and value < low:
+                reasons.append(f"below {low:g}")
+            if high is not None and value > high:
+                reasons.append(f"above {high:g}")
+            alert = ", ".join(reasons)
+            if alert and alert != self._alerts.get(name):
+                logger.warning("ALERT %s %s %g: %s", name, self.value_column, value, alert)
+            if alert:
+                self._alerts[name] = alert
+            else:
+                self._alerts.pop(name, None)
+
+    def _change(self, row):
+        """Percent change from the newest point at least change_minutes older."""
+        count = self._count[row]
+        kept = min(count, self.history)
+        order = (count - kept + np.arange(kept)) % self.history
+        times = self._times[row, order]
+        target = times[-1] - self.change_ns
+        i = int(np.searchsorted(times, target, side="right")) - 1
+        if i < 0:
+            return np.nan
+        then = self._values[row, order[i]]
+        return (self._values[row, order[-1]] - then) / abs(then) * 100 if then else np.nan
+
+    def snapshot(self, names):
+        """Return one row of statistics per entity in names that has data."""
+        records = []
+        for name in names:
+            row = self._rows.get(name)
+            if row is None or self._count[row] == 0:
+                continue
+            k = min(self._count[row], self.window)
+            mean = self._sum[row] / k
+            std = np.sqrt(max(self._sumsq[row] / k - mean * mean, 0.0))
+            records.append(
+                {
+                    self.entity_column: name,
+                    self.value_column: self._latest(row),
+                    "Mean": mean,
+                    "Std": std,
+                    f"Change_{self.change_minutes:g}m_%": self._change(row),
+                    "Z": self._zscore[row],
+                    "Alert": self._alerts.get(name, ""),
+                }
+            )
+        df = pd.DataFrame.from_records(records)
+        return df.round(2) if len(df) else df
+
+    def alerts(self):
+        """Return {entity name: alert text} for the entities alerting now."""
+        return dict(self._alerts)
@@ -0,0 +1,72 @@
+"""
+Purpose: Fetch every item of a poll cycle concurrently.
+
+A cycle used to await each location or ticker one after another, so its wall
+time was the sum of all round trips. fetch_batch() starts them all at once,
+with a cap on how many are in flight, so a cycle takes about as long as its
+slowest request. One failed item is recorded and does not abort the others.
+"""
+
+import asyncio
+
+from fetch import RateLimitedError
+from util_config import get_setting
+from util_logger import setup_logger
+
+logger, log_filename = setup_logger(__file__)
+
+DEFAULT_MAX_CONCURRENCY = get_setting("CINTEL_FETCH_CONCURRENCY", 10, int)
+
+
+class BatchResult:
+    """Successful results and errors of one batch, both keyed by item."""
+
+    def __init__(self):
+        self.results = {}
+        self.errors = {}
+
+    @property
+    def ok(self):
+        """True if every item succeeded."""
+        return not self.errors
+
+
+def rate_limit(errors):
+    """Return the RateLimitedError among errors asking the longest wait, or None.
+    @param errors: dict of item to exception, e.g. BatchResult.errors.
+    """
+    limits = [e for e in errors.values() if isinstance(e, RateLimitedError)]
+    return max(limits, key=lambda e: e.retry_after or 0, default=None)
+
+
+async def fetch_batch(keys, fetch_one, max_concurrency=None):
+    """Call fetch_one(key) for every key concurrently.
+    @param keys: the items to fetch, e.g. locations or tickers.
+    @param fetch_one: an async function taking one key.
+    @param max_concurrency: most calls in flight at once.
+    @returns: a BatchResult; results keep the order of keys.
+    """
+    if max_concurrency is None:
+        max_concurrency = DEFAULT_MAX_CONCURRENCY
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_one(key):
+        async with semaphore:
+            return await fetch_one(key)
+
+    keys = list(keys)
+    outcomes = await asyncio.gather(
+        *(run_one(key) for key in keys), return_exceptions=True
+    )
+
+    batch = BatchResult()
+    for key, outcome in zip(keys, outcomes):
+        if isinstance(outcome, asyncio.CancelledError):
+            raise outcome
+        if isinstance(outcome, Exception):
+            batch.errors[key] = outcome
+            logger.error("ERROR fetching %s: %r", key, outcome)
+        else:
+            batch.results[key] = outcome
+    logger.info("Fetched %d of %d items", len(batch.results), len(keys))
+    return batch
@@ -0,0 +1,75 @@
+"""
+Purpose: Register the ingestion sources, and run them without the app.
+
+Importing this module adds the weather and stock pollers to the process-wide
+scheduler (or, with CINTEL_REPLAY_MODE=stream, replays of recorded polls;
+see continuous_replay); app.py starts them at startup. When the app only
+watches the data files (CINTEL_UPDATE_MODE=watch), run the pollers in their
+own process:
+
+    python continuous_ingest.py
+"""
+
+import asyncio
+
+import continuous_location
+import continuous_stock
+from continuous_replay import BACKFILL, REPLAY_MODE, ReplayStream, backfill, install, read_polls
+from continuous_scheduler import scheduler
+from fetch import close_client_session
+from util_logger import setup_logger
+
+logger, log_filename = setup_logger(__file__)
+
+# name -> (poll function, store, storage backend, seconds between polls,
+# seconds between polls of the entities that sessions are viewing)
+SOURCES = {
+    "location": (
+        continuous_location.update_csv_location,
+        continuous_location.store,
+        continuous_location.storage,
+        continuous_location.POLL_INTERVAL,
+        continuous_location.VIEWED_INTERVAL,
+    ),
+    "stock": (
+        continuous_stock.update_csv_stock,
+        continuous_stock.store,
+        continuous_stock.storage,
+        continuous_stock.POLL_INTERVAL,
+        continuous_stock.VIEWED_INTERVAL,
+    ),
+}
+
+# One set of pollers per process, shared by every session.
+for name, (poll, store, storage, interval, viewed_interval) in SOURCES.items():
+    if REPLAY_MODE == "stream":
+        poll = ReplayStream(name, store, storage, read_polls(name))
+        interval = poll.interval
+        viewed_interval = None  # a replay has no entities to pick
+    scheduler.add_source(name, poll, interval=interval, viewed_interval=viewed_interval)
+install(scheduler)
+
+
+def start():
+    """Backfill the stores if asked to (CINTEL_BACKFILL), then start polling."""
+    if BACKFILL:
+        for name, (_, store, storage, _, _) in SOURCES.items():
+            backfill(name, store, storage)
+    scheduler.start()
+
+
+async def run_forever():
+    """Poll every source until cancelled (e.g. by Ctrl+C)."""
+    start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await scheduler.stop()
+        await close_client_session()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_forever())
+    except KeyboardInterrupt:
+        logger.info("Stopped by user")
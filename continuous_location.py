@@ -1,102 +1,257 @@
 """
 Purpose: Illustrate addition of continuous information. 
+
+By default, locations that fall in the same grid cell (CINTEL_WEATHER_GRID
+degrees) share one reading, and cells whose location has an OpenWeatherMap
+city id are fetched up to 20 per request from the group endpoint. The rest,
+and the cities of a group request that fails (other than by rate limiting),
+are fetched by coordinates.
+CINTEL_WEATHER_FETCH_MODE=single fetches each location on its own.
 """
 
-import asyncio
 from datetime import datetime
 from pathlib import Path
-import os
-
-import pandas as pd
-from collections import deque
-from dotenv import load_dotenv
 
-from fetch import fetch_from_url
+from continuous_analytics import RollingAnalytics
+from continuous_batch import fetch_batch, rate_limit
+from continuous_scheduler import viewed_polls
+from continuous_storage import make_backend
+from continuous_store import TimeSeriesStore
+from fetch import check_status, fetch_from_url
+from util_cache import AsyncTTLCache, NewReadings
+from util_config import get_setting
+from util_entities import entities
 from util_logger import setup_logger
+from util_metrics import timed, timer
 
 logger, log_filename = setup_logger(__file__)
 
 
 def get_API_key():
-    load_dotenv()
-    key = os.getenv("OPEN_WEATHER_API_KEY")
-    return key
+    """Return the OpenWeatherMap key (the .env file is read once; see util_config)."""
+    return get_setting("OPEN_WEATHER_API_KEY")
 
 
 def lookup_lat_long(location):
     """Return the latitude and longitude for the given location."""
-    locations_dictionary = {
-        "Seattle WA": {"latitude": 47.606209, "longitude": -122.332069},
-        "Portland OR": {"latitude": 45.512230, "longitude": -122.658722},
-        "San Francisco CA": {"latitude": 32.715760, "longitude": -117.163820},
-        "San Diego CA": {"latitude": 32.715736, "longitude": -117.161087},
-        "Phoenix AZ": {"latitude": 33.448200, "longitude": -111.072578},
+    entity = entities.locations[location]
+    return entity.latitude, entity.longitude
+
+
+# Where weather is fetched from; benchmarks point this at a local stub.
+OPENWEATHER_URL = get_setting("CINTEL_OPENWEATHER_URL", "https://api.openweathermap.org")
+
+# "bulk" asks for many cities per request; "single" asks per location.
+WEATHER_FETCH_MODE = get_setting("CINTEL_WEATHER_FETCH_MODE", "bulk")
+
+# Size of a grid cell in degrees; locations in one cell share a reading.
+WEATHER_GRID = get_setting("CINTEL_WEATHER_GRID", 0.1, float)
+
+# Most city ids per group request, as allowed by the API.
+GROUP_SIZE = 20
+
+# Identical weather requests within the TTL share one upstream call.
+weather_cache = AsyncTTLCache(
+    "weather",
+    ttl=get_setting("CINTEL_WEATHER_CACHE_TTL", 30, float),
+    max_size=get_setting("CINTEL_CACHE_SIZE", 1024, int),
+    stale_ttl=get_setting("CINTEL_WEATHER_STALE_TTL", 300, float),
+)
+
+
+# Which reading was stored last per location; one is never stored twice.
+new_readings = NewReadings(weather_cache)
+
+
+def grid_cell(lat, long):
+    """Return the grid cell (a pair of ints) that lat, long falls in."""
+    return round(lat / WEATHER_GRID), round(long / WEATHER_GRID)
+
+
+async def get_temperature_from_openweathermap(lat, long, max_age=None):
+    """Return the temperature in F at lat, long (cached per grid cell; see util_cache)."""
+    return await weather_cache.get(
+        grid_cell(lat, long), lambda: fetch_temperature_from_openweathermap(lat, long), max_age
+    )
+
+
+async def get_temperatures(locations, max_age=None):
+    """Return the temperatures of many locations, one reading per grid cell (cached).
+    @param locations: util_entities Location objects.
+    @param max_age: refetch readings older than this many seconds.
+    @returns: ({location name: temp}, {location name: exception}).
+    """
+    cells = {}
+    for location in locations:
+        cells.setdefault(grid_cell(location.latitude, location.longitude), []).append(location)
+    # One location stands for each cell; prefer one with a city id.
+    representatives = {
+        cell: next((loc for loc in members if loc.city_id), members[0])
+        for cell, members in cells.items()
     }
-    answer_dict = locations_dictionary[location]
-    lat = answer_dict["latitude"]
-    long = answer_dict["longitude"]
-    return lat, long
 
+    async def fetch_many(missing):
+        return await fetch_cell_temperatures({cell: representatives[cell] for cell in missing})
+
+    temps, errors = await weather_cache.get_many(list(cells), fetch_many, max_age)
+    by_name = {}
+    failed = {}
+    for cell, members in cells.items():
+        for location in members:
+            if cell in temps:
+                by_name[location.name] = temps[cell]
+            else:
+                failed[location.name] = errors[cell]
+    return by_name, failed
+
+
+async def fetch_cell_temperatures(representatives):
+    """Return {cell: temp} for {cell: Location}, by group request where possible."""
+    cell_by_city = {loc.city_id: cell for cell, loc in representatives.items() if loc.city_id}
+    by_coords = [cell for cell, loc in representatives.items() if not loc.city_id]
 
-async def get_temperature_from_openweathermap(lat, long):
-    logger.info("Calling get_temperature_from_openweathermap for {lat}, {long}}")
+    city_ids = list(cell_by_city)
+    chunks = [tuple(city_ids[i : i + GROUP_SIZE]) for i in range(0, len(city_ids), GROUP_SIZE)]
+    groups = await fetch_batch(chunks, fetch_group_temperatures)
+    temps = {}
+    for result in groups.results.values():
+        for city_id, temp in result.items():
+            if city_id in cell_by_city:
+                temps[cell_by_city[city_id]] = temp
+    if groups.errors and rate_limit(groups.errors) is None:
+        # Unless rate limited, when one request per city would only make it worse.
+        failed = [cell_by_city[city_id] for chunk in groups.errors for city_id in chunk]
+        logger.warning("Group requests failed; fetching %d cities by coordinates", len(failed))
+        by_coords.extend(failed)
+
+    async def fetch_cell(cell):
+        location = representatives[cell]
+        return await fetch_temperature_from_openweathermap(location.latitude, location.longitude)
+
+    singles = await fetch_batch(by_coords, fetch_cell)
+    temps.update(singles.results)
+    limited = rate_limit({**groups.errors, **singles.errors})
+    if limited is not None and not temps:
+        raise limited  # for every cell, so the scheduler backs off
+    return temps
+
+
+@timed("fetch", source="location")
+async def fetch_group_temperatures(city_ids):
+    """Return {city id: temp} for up to GROUP_SIZE cities, in one request."""
+    logger.info("Calling group endpoint for %d cities", len(city_ids))
+    ids = ",".join(str(city_id) for city_id in city_ids)
+    url = f"{OPENWEATHER_URL}/data/2.5/group?id={ids}&appid={get_API_key()}&units=imperial"
+    result = await fetch_from_url(url, "json")
+    check_status(result, "Group request")
+    return {item["id"]: item["main"]["temp"] for item in result.data["list"]}
+
+
+@timed("fetch", source="location")
+async def fetch_temperature_from_openweathermap(lat, long):
+    logger.info("Calling get_temperature_from_openweathermap for %s, %s", lat, long)
     api_key = get_API_key()
-    open_weather_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={long}&appid={api_key}&units=imperial"
-    logger.info(f"Calling fetch_from_url for {open_weather_url}")
+    open_weather_url = f"{OPENWEATHER_URL}/data/2.5/weather?lat={lat}&lon={long}&appid={api_key}&units=imperial"
+    logger.debug("Calling fetch_from_url for %s", open_weather_url)
     result = await fetch_from_url(open_weather_url, "json")
-    logger.info(f"Data from openweathermap: {result}")
+    check_status(result, "Weather request")
+    logger.debug("Data from openweathermap: %s", result.data)
     temp_F = result.data["main"]["temp"]
     return temp_F
 
 
-def init_csv_file(file_path):
-    df_empty = pd.DataFrame(
-        columns=["Location", "Latitude", "Longitude", "Time", "Temp_F"]
-    )
-    df_empty.to_csv(file_path, index=False)
+# Seconds between polls of every location, and of those sessions are viewing.
+POLL_INTERVAL = get_setting("CINTEL_LOCATION_INTERVAL", 60, float)
+VIEWED_INTERVAL = get_setting("CINTEL_LOCATION_VIEWED_INTERVAL", 30, float)
+
+# Keep the most recent readings (rows, across all locations) between cycles,
+# with room for the extra rows of the viewed locations on top.
+num_updates = get_setting("CINTEL_LOCATION_HISTORY", 20, int)
+capacity = num_updates * (1 + viewed_polls(POLL_INTERVAL, VIEWED_INTERVAL))
+
+COLUMNS = {
+    "Location": "category",
+    "Latitude": "float",
+    "Longitude": "float",
+    "Time": "time",
+    "Temp_F": "float",
+}
+
+# Sessions read from the in-memory store; the storage backend persists it.
+base_path = Path(__file__).parent.joinpath("data").joinpath("reactive_location")
+storage = make_backend(
+    get_setting("CINTEL_STORAGE_BACKEND", "csv"), base_path, COLUMNS, capacity
+)
 
+store = TimeSeriesStore(COLUMNS, capacity=capacity, loader=storage.load)
 
-async def update_csv_location():
-    """Update the CSV file with the latest location information."""
+# Rolling statistics and alerts, updated as rows arrive (see app.py).
+analytics = RollingAnalytics("Location", "Temp_F", thresholds=entities.locations.thresholds())
+
+
+async def update_csv_location(names=None):
+    """Fetch the latest temperatures once and update the store and storage.
+
+    Every location in the registry (util_entities) is fetched
+    concurrently; a location that fails is skipped for this cycle, and
+    one whose cached reading was already stored is left out. A poll with no
+    new readings because the upstream failed (e.g. rate limited) raises its
+    error, so the scheduler backs off.
+
+    The ingestion scheduler calls this once per poll interval, and with
+    names more often for the locations that sessions are viewing.
+    @param names: fetch only these locations; None fetches every one.
+    @returns: the list of new records.
+    """
     logger.info("Calling update_csv_location")
-    try:
-        locations = ["Seattle WA", "Portland OR", "San Francisco CA", "San Diego CA", "Phoenix AZ"]
-        update_interval = 60
-        total_runtime = 15 * 60
-        num_updates = 20
-        logger.info(f"update_interval: {update_interval}")
-        logger.info(f"total_runtime: {total_runtime}")
-        logger.info(f"num_updates: {num_updates}")
-
-        records_deque = deque(maxlen=num_updates)
-
-        fp = Path(__file__).parent.joinpath("data").joinpath("reactive_location.csv")
-
-        if not os.path.exists(fp):
-            init_csv_file(fp)
-
-        logger.info(f"Initialized csv file at {fp}")
-
-        for _ in range(num_updates):  
-            for location in locations:
-                lat, long = lookup_lat_long(location)
-                new_temp = await get_temperature_from_openweathermap(lat, long)
-                time_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  
-                new_record = {
-                    "Location": location,
-                    "Latitude": lat,
-                    "Longitude": long,
-                    "Time": time_now,
-                    "Temp_F": new_temp,
-                }
-                records_deque.append(new_record)
-
-                df = pd.DataFrame(records_deque)
-
-            df.to_csv(fp, index=False, mode="w")
-            logger.info(f"Saving temperatures to {fp}")
-
-            await asyncio.sleep(update_interval)
-
-    except Exception as e:
-        logger.error(f"ERROR in update_csv_location: {e}")
\ No newline at end of file
+    if names is None:
+        locations = list(entities.locations)
+        max_age = None
+    else:
+        locations = [entities.locations[name] for name in names if name in entities.locations]
+        max_age = VIEWED_INTERVAL / 4  # fresher than the cache would keep them
+
+    if WEATHER_FETCH_MODE == "single":
+
+        async def fetch_location(location):
+            lat, long = lookup_lat_long(location)
+            return await get_temperature_from_openweathermap(lat, long, max_age)
+
+        batch = await fetch_batch([loc.name for loc in locations], fetch_location)
+        temps, errors = batch.results, batch.errors
+    else:
+        temps, errors = await get_temperatures(locations, max_age)
+    if errors:
+        logger.warning("No temperature for %d of %d locations", len(errors), len(locations))
+    temps, stale = new_readings.select(
+        temps, lambda location: grid_cell(*lookup_lat_long(location))
+    )
+    if stale:
+        logger.warning("Only stale temperatures for %d locations", len(stale))
+    if not temps:
+        # Nothing new is a failed poll if the upstream failed, e.g. rate limited.
+        errors = {**errors, **stale}
+        if errors:
+            raise rate_limit(errors) or RuntimeError(f"No new temperatures; {len(errors)} errors")
+        logger.info("No new temperatures since the last poll")
+        return []
+
+    time_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    new_records = []
+    for location, new_temp in temps.items():
+        lat, long = lookup_lat_long(location)
+        new_record = {
+            "Location": location,
+            "Latitude": lat,
+            "Longitude": long,
+            "Time": time_now,
+            "Temp_F": new_temp,
+        }
+        new_records.append(new_record)
+
+    with timer("write", source="location"):
+        store.append(new_records)
+        storage.save(new_records)
+    logger.info("Saving temperatures with the %s backend", storage.name)
+    logger.info("Weather cache: %s", weather_cache.stats())
+    return new_records
@@ -0,0 +1,204 @@
+"""
+Purpose: Record the ingestion and play it back: backfill, replay and offline fetches.
+
+Captures are JSON lines files in CINTEL_CAPTURE_DIR (data/captures by
+default). CINTEL_REPLAY_MODE chooses what the ingestion does with them:
+
+- "off" (the default): nothing is recorded or replayed
+- "record": the new records of every poll are appended to <source>.jsonl,
+  and every fetch_from_url response to fetch.jsonl (without the API key)
+- "fetch": fetch_from_url answers from fetch.jsonl instead of the network.
+  The pollers run as usual, so the same captures give the same rows, offline.
+  Each URL's responses are given in the order recorded, then again.
+- "stream": the recorded polls take the place of the pollers and go through
+  the same store, storage and session updates, CINTEL_REPLAY_SPEED times
+  faster than recorded. Rows keep their recorded spacing but are moved to
+  start when the replay starts, and the capture starts over when it ends.
+
+With CINTEL_BACKFILL=1 (in any mode), a store that is still empty after
+loading its storage is first filled with the most recent recorded rows, so
+the dashboard does not start empty after a restart.
+
+The pollers and backfill can also run without the app, e.g.
+
+    CINTEL_REPLAY_MODE=stream CINTEL_REPLAY_SPEED=60 python continuous_ingest.py
+"""
+
+import base64
+import json
+import statistics
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import pandas as pd
+
+import fetch
+from fetch import HttpResponse
+from util_config import as_bool, get_setting
+from util_logger import setup_logger
+from util_metrics import timer
+
+logger, log_filename = setup_logger(__file__)
+
+REPLAY_MODE = get_setting("CINTEL_REPLAY_MODE", "off")
+REPLAY_SPEED = get_setting("CINTEL_REPLAY_SPEED", 1.0, float)
+BACKFILL = get_setting("CINTEL_BACKFILL", False, as_bool)
+CAPTURE_DIR = Path(
+    get_setting("CINTEL_CAPTURE_DIR", str(Path(__file__).parent.joinpath("data", "captures")))
+)
+
+# Query parameters left out of recorded requests.
+SECRET_PARAMS = {"appid"}
+
+# Seconds between replayed polls when a capture has only one.
+DEFAULT_GAP = 60.0
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def request_key(url):
+    """Return url without its host and secrets, e.g. to match a recorded request."""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query = [(k, v) for k, v in query if k not in SECRET_PARAMS]
+    return f"{parts.path}?{urlencode(query)}"
+
+
+def append_line(path, item):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as file:
+        file.write(json.dumps(item) + "\n")
+
+
+def read_lines(path):
+    """Return the objects of a JSON lines file; [] if there is none."""
+    if not path.exists():
+        return []
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class FetchRecorder:
+    """Fetches from the network and appends every response to a capture."""
+
+    def __init__(self, path):
+        self.path = path
+
+    async def fetch(self, url, type, fetch_live):
+        response = await fetch_live()
+        data = response.data
+        item = {"key": request_key(url), "type": type, "status": response.status}
+        if isinstance(data, bytes):
+            item["data_base64"] = base64.b64encode(data).decode("ascii")
+        else:
+            item["data"] = data
+        append_line(self.path, item)
+        return response
+
+
+class FetchReplayer:
+    """Answers requests from a capture, never from the network."""
+
+    def __init__(self, path):
+        self._responses = defaultdict(list)  # request key -> recorded responses
+        self._given = defaultdict(int)  # request key -> responses given so far
+        for item in read_lines(path):
+            if "data_base64" in item:
+                data = base64.b64decode(item["data_base64"])
+            else:
+                data = item.get("data")
+            self._responses[item["key"]].append((item["status"], data))
+        logger.info(f"Replaying {sum(map(len, self._responses.values()))} responses from {path}")
+
+    async def fetch(self, url, type, fetch_live):
+        key = request_key(url)
+        responses = self._responses.get(key)
+        if not responses:
+            raise LookupError(f"No recorded response for {key}")
+        status, data = responses[self._given[key] % len(responses)]
+        self._given[key] += 1
+        return HttpResponse(status, data)
+
+
+class ReplayStream:
+    """Plays the recorded polls of one source back, as that source's poll function."""
+
+    def __init__(self, name, store, storage, polls, speed=REPLAY_SPEED):
+        """
+        @param polls: lists of records, one per recorded poll, oldest first.
+        @param speed: how many times faster than recorded to play them.
+        """
+        self.name = name
+        self.store = store
+        self.storage = storage
+        self.polls = [records for records in polls if records]
+        times = [pd.Timestamp(records[0]["Time"]) for records in self.polls]
+        gaps = [(b - a).total_seconds() for a, b in zip(times, times[1:])]
+        self.gap = statistics.median(gaps) if gaps else DEFAULT_GAP
+        self.interval = self.gap / speed  # seconds between replayed polls
+        self._first = times[0] if times else None
+        self._span = (times[-1] - times[0]).total_seconds() + self.gap if times else 0.0
+        self._start = None
+        self._played = 0
+
+    async def __call__(self):
+        """Play the next recorded poll into the store and storage.
+        @returns: the list of new records, as update_csv_* return.
+        """
+        if not self.polls:
+            raise RuntimeError(f"Nothing recorded for {self.name} in {CAPTURE_DIR}")
+        if self._start is None:
+            self._start = pd.Timestamp.now().floor("s")
+        rounds, i = divmod(self._played, len(self.polls))
+        self._played += 1
+        shift = self._start - self._first + pd.Timedelta(seconds=rounds * self._span)
+        new_records = [
+            {**record, "Time": (pd.Timestamp(record["Time"]) + shift).strftime(TIME_FORMAT)}
+            for record in self.polls[i]
+        ]
+        with timer("write", source=self.name):
+            self.store.append(new_records)
+            self.storage.save(new_records)
+        return new_records
+
+
+def read_polls(name):
+    """Return the recorded polls of a source: lists of records, oldest first."""
+    return [item["records"] for item in read_lines(CAPTURE_DIR / f"{name}.jsonl")]
+
+
+def record_poll(name, result):
+    """Scheduler subscriber appending the new records of a poll to its capture."""
+    if isinstance(result, list) and result:
+        append_line(CAPTURE_DIR / f"{name}.jsonl", {"records": result})
+
+
+def backfill(name, store, storage):
+    """Fill an empty store (and its storage) with the most recent recorded rows.
+    @returns: the number of rows loaded.
+    """
+    if len(store):
+        return 0
+    rows = [record for records in read_polls(name) for record in records]
+    rows = rows[-store.capacity :]
+    if rows:
+        with timer("write", source=name):
+            store.append(rows)
+            storage.save(rows)
+        logger.info(f"Backfilled {len(rows)} {name} rows from {CAPTURE_DIR}")
+    return len(rows)
+
+
+def install(scheduler):
+    """Record or replay as CINTEL_REPLAY_MODE says; call once, before polling."""
+    if REPLAY_MODE == "record":
+        fetch.set_tap(FetchRecorder(CAPTURE_DIR / "fetch.jsonl"))
+        scheduler.subscribe(record_poll)
+        logger.info(f"Recording the ingestion to {CAPTURE_DIR}")
+    elif REPLAY_MODE == "fetch":
+        fetch.set_tap(FetchReplayer(CAPTURE_DIR / "fetch.jsonl"))
+    elif REPLAY_MODE == "stream":
+        logger.info(f"Replaying the ingestion from {CAPTURE_DIR} at {REPLAY_SPEED:g}x")
+    elif REPLAY_MODE != "off":
+        raise ValueError(f"Unknown CINTEL_REPLAY_MODE {REPLAY_MODE!r}")
@@ -0,0 +1,292 @@
+"""
+Purpose: Run every ingestion source once per process, not once per session.
+
+The scheduler owns one polling task per source (weather, stocks, ...).
+It is started once at app startup and stopped at shutdown, so the number of
+upstream requests does not depend on how many browser sessions are open.
+
+Polls are due on a fixed-rate grid (start, start + interval, ...), so the
+cadence does not drift by the time each poll takes. Each poll starts a
+random fraction of the interval (up to CINTEL_POLL_JITTER) after it is
+due, so sources and workers do not all hit the upstreams at once. At most
+one poll per source is ever in flight; deadlines that pass while a poll is
+still running are skipped rather than stacked, and counted as an overrun.
+
+Intervals adapt per source:
+
+- after a failed poll the interval doubles, up to CINTEL_MAX_BACKOFF times
+  the configured one, and it is back to normal after the next success; a
+  rate-limited poll (HTTP 429) also waits at least as long as the upstream's
+  Retry-After asks
+- a source given a viewed_interval also polls, that often, only the entities
+  that open sessions are showing (see set_viewing); these polls fall between
+  the full polls' deadlines, and one that would come close to a full poll is
+  left out, since the full poll covers it
+
+Results are fanned out to subscribers after every successful poll.
+Each poll is timed (stage "poll") and counted per source in util_metrics,
+along with how late it started (cycle lag), how far it ran past the next
+deadline (overrun), the current interval and the age of the last success.
+"""
+
+import asyncio
+import math
+import random
+import time
+
+from fetch import RateLimitedError
+from util_config import get_setting
+from util_logger import setup_logger
+from util_metrics import (
+    collectors,
+    cycle_lag,
+    cycle_overrun,
+    source_age,
+    source_errors,
+    source_interval,
+    source_polls,
+    source_rate_limited,
+    source_skipped,
+    timed,
+)
+
+logger, log_filename = setup_logger(__file__)
+
+# Most delay added to a poll's start, as a fraction of its interval.
+POLL_JITTER = get_setting("CINTEL_POLL_JITTER", 0.1, float)
+
+# Most the interval grows to after repeated failures, as a multiple of it.
+MAX_BACKOFF = get_setting("CINTEL_MAX_BACKOFF", 16, float)
+
+
+def viewed_polls(interval, viewed_interval):
+    """Return the most polls of viewed entities per full poll (0 if there are none).
+
+    Stores size their window with this, so the extra rows the viewed
+    entities get do not push out the history of the others.
+    """
+    if viewed_interval is None or not 0 < viewed_interval < interval:
+        return 0
+    return math.ceil(interval / viewed_interval)
+
+
+class PollSource:
+    """One named ingestion source and its polling state."""
+
+    def __init__(self, name, poll, interval, viewed_interval=None):
+        self.name = name
+        self.poll = poll  # async callable; given entity names, polls only those
+        self.interval = interval  # seconds between polls
+        self.viewed_interval = viewed_interval  # seconds between polls of viewed entities
+        self.viewers = {}  # viewer (e.g. a session id) -> entity names it shows
+        self.backoff = 1.0  # multiplies the intervals; doubled after each failure
+        self.resume_at = None  # loop time a rate-limited source waits for
+        self.full_due = None  # loop time of a deadline on the full polls' grid
+        self.polling_viewed = False  # whether the poll in flight is of viewed entities
+        self.lock = asyncio.Lock()
+        self.tasks = []
+        self.last_result = None
+        self.last_error = None
+        self.last_success = None  # time.monotonic() of the last successful poll
+        self.runs = 0
+        self.errors = 0
+        self.skipped = 0
+
+    def period(self, viewed=False):
+        """Seconds between polls (of the viewed entities only, if viewed), after backoff."""
+        return (self.viewed_interval if viewed else self.interval) * self.backoff
+
+    def viewed(self):
+        """Every entity that some viewer shows, sorted."""
+        return sorted(set().union(*self.viewers.values()))
+
+    def near_full_poll(self, when, margin):
+        """True if loop time when is within margin of a full poll's deadline."""
+        if self.full_due is None:
+            return False
+        period = self.period()
+        offset = (when - self.full_due) % period
+        return min(offset, period - offset) < margin
+
+
+class IngestionScheduler:
+    """Process-wide owner of the ingestion polling loops."""
+
+    def __init__(self):
+        self._sources = {}
+        self._subscribers = []
+        self._running = False
+
+    @property
+    def running(self):
+        return self._running
+
+    def add_source(self, name, poll, interval=60, viewed_interval=None):
+        """Register (or replace) a source polled every interval seconds.
+        @param viewed_interval: if shorter than interval, also poll the
+        entities that sessions are viewing this often, calling poll(names).
+        """
+        if name in self._sources and self._sources[name].tasks:
+            raise RuntimeError(f"Cannot replace source {name} while running")
+        if not viewed_polls(interval, viewed_interval):
+            viewed_interval = None
+        self._sources[name] = PollSource(name, poll, interval, viewed_interval)
+
+    def set_viewing(self, name, viewer, entity_names):
+        """Record the entities of source name that viewer (e.g. a session id) shows."""
+        source = self._sources.get(name)
+        if source is None:
+            return
+        if entity_names:
+            source.viewers[viewer] = frozenset(entity_names)
+        else:
+            source.viewers.pop(viewer, None)
+
+    def stop_viewing(self, viewer):
+        """Forget what viewer shows, e.g. when its session ends."""
+        for source in self._sources.values():
+            source.viewers.pop(viewer, None)
+
+    def subscribe(self, callback):
+        """Call callback(source_name, result) after every successful poll.
+        @returns: a function that removes the subscription.
+        """
+        self._subscribers.append(callback)
+
+        def unsubscribe():
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+        return unsubscribe
+
+    def start(self):
+        """Start one polling task per source. Safe to call more than once."""
+        if self._running:
+            return
+        self._running = True
+        for source in self._sources.values():
+            source.tasks = [asyncio.create_task(self._run(source))]
+            if source.viewed_interval is not None:
+                source.tasks.append(asyncio.create_task(self._run(source, viewed=True)))
+        logger.info(f"Started ingestion for {list(self._sources)}")
+
+    async def stop(self):
+        """Cancel the polling tasks and wait for them to finish."""
+        if not self._running:
+            return
+        self._running = False
+        tasks = [task for s in self._sources.values() for task in s.tasks]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for source in self._sources.values():
+            source.tasks = []
+        logger.info("Stopped ingestion")
+
+    async def poll_now(self, name, entity_names=None):
+        """Poll one source unless a poll of it is already in flight.
+        @param entity_names: poll only these entities; None polls them all.
+        @returns: the poll result, or None if skipped or failed.
+        """
+        source = self._sources[name]
+        if source.lock.locked():
+            if entity_names is not None:
+                # The poll in flight fetches these too, or just did.
+                logger.debug("Skipping %s poll of viewed entities; a poll is running", name)
+                return None
+            if source.polling_viewed:
+                logger.debug("Waiting for the %s poll of viewed entities", name)
+            else:
+                source.skipped += 1
+                source_skipped.inc(source=name)
+                logger.info("Skipping %s poll; previous poll still running", name)
+                return None
+
+        async def poll():
+            if entity_names is None:
+                return await source.poll()
+            return await source.poll(entity_names)
+
+        async with source.lock:
+            source.polling_viewed = entity_names is not None
+            try:
+                result = await timed("poll", source=name)(poll)()
+            except Exception as e:
+                source.errors += 1
+                source_errors.inc(source=name)
+                source.last_error = e
+                logger.error("ERROR polling %s: %s", name, e)
+                self._back_off(source, e)
+                return None
+            if source.backoff != 1.0:
+                source.backoff = 1.0
+                logger.info("Polling %s every %g s again", name, source.interval)
+            source.runs += 1
+            source.last_result = result
+            source.last_success = time.monotonic()
+            source_polls.inc(source=name)
+        self._publish(name, result)
+        return result
+
+    def _back_off(self, source, error):
+        source.backoff = min(source.backoff * 2, MAX_BACKOFF)
+        if isinstance(error, RateLimitedError):
+            source_rate_limited.inc(source=source.name)
+            if error.retry_after:
+                source.resume_at = asyncio.get_running_loop().time() + error.retry_after
+        logger.warning("Backing off %s: polling every %g s", source.name, source.period())
+
+    def _publish(self, name, result):
+        for callback in list(self._subscribers):
+            try:
+                callback(name, result)
+            except Exception as e:
+                logger.error("ERROR in subscriber for %s: %s", name, e)
+
+    def collect_metrics(self):
+        """Refresh the per-source age gauge; called before /metrics renders."""
+        now = time.monotonic()
+        for name, source in self._sources.items():
+            if source.last_success is not None:
+                source_age.set(now - source.last_success, source=name)
+
+    async def _run(self, source, viewed=False):
+        """Poll source on a fixed-rate grid of deadlines, until cancelled."""
+        loop = asyncio.get_running_loop()
+        label = f"{source.name}:viewed" if viewed else source.name
+        due = loop.time()
+        if viewed:
+            due += source.period(viewed) / 2  # off the full polls' grid
+        while True:
+            if source.resume_at is not None:
+                due = max(due, source.resume_at)  # as long as a 429 asked
+            if not viewed:
+                source.full_due = due
+            period = source.period(viewed)
+            source_interval.set(period, source=label)
+            if viewed and source.near_full_poll(due, period / 4):
+                logger.debug("Leaving out the %s poll; a full poll is due", label)
+            else:
+                start = due + random.uniform(0, POLL_JITTER * period)
+                await asyncio.sleep(max(0.0, start - loop.time()))
+                cycle_lag.observe(max(0.0, loop.time() - start), source=label)
+                entity_names = source.viewed() if viewed else None
+                if not viewed or entity_names:
+                    await self.poll_now(source.name, entity_names)
+
+            # The next deadline; any that passed while polling are skipped.
+            period = source.period(viewed)
+            due += period
+            overrun = loop.time() - due
+            if overrun > 0:
+                cycle_overrun.observe(overrun, source=label)
+                missed = math.ceil(overrun / period)
+                source.skipped += missed
+                source_skipped.inc(missed, source=label)
+                due += missed * period
+                logger.warning("%s poll overran by %.2f s; skipped %d polls", label, overrun, missed)
+
+
+# The one scheduler for this process.
+scheduler = IngestionScheduler()
+collectors.append(scheduler.collect_metrics)
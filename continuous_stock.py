@@ -1,96 +1,248 @@
 """
-Store the last 15 minutes of stock values for several companies
+Store the most recent stock values for several companies
 
-Information is updated once per minute.
+Information is updated once per poll interval (once per minute by default).
+
+By default prices come from Yahoo's multi-symbol quote endpoint, many tickers
+per request and only the fields we read. Tickers are split into chunks that
+keep each URL short; a chunk the server rejects as too large is split again,
+and the tickers of a chunk that fails are fetched one by one from the
+per-ticker endpoint. CINTEL_STOCK_FETCH_MODE=single always fetches per ticker.
 """
 
 import asyncio
-import os
 from pathlib import Path
 from datetime import datetime
-
-import pandas as pd
-from collections import deque
+from urllib.parse import quote
 
 from util_logger import setup_logger
-from fetch import fetch_from_url
+from util_metrics import timed, timer
+from continuous_analytics import RollingAnalytics
+from continuous_batch import fetch_batch, rate_limit
+from continuous_scheduler import viewed_polls
+from continuous_storage import make_backend
+from continuous_store import TimeSeriesStore
+from fetch import check_status, fetch_from_url
+from util_cache import AsyncTTLCache, NewReadings
+from util_config import get_setting
+from util_entities import entities
 
 logger, log_filename = setup_logger(__file__)
 
 def lookup_ticker(company):
-    stocks_dictionary = {
-        "Nordstrom Inc": "JWN",
-        "Lululemon Athletica Inc": "LULU",
-        "Starbucks Corporation": "SBUX",
-        "NIKE Inc": "NKE",
-        "Amazon.com Inc": "AMZN",
-    }
-    ticker = stocks_dictionary[company]
-    return ticker
-
-
-async def get_stock_price(ticker):
-    logger.info(f"Calling get_stock_price for {ticker}")
-    stock_api_url = f"https://query1.finance.yahoo.com/v7/finance/options/{ticker}"
-    logger.info(f"Calling fetch_from_url for {stock_api_url}")
+    return entities.companies[company].ticker
+
+
+# Where prices are fetched from; benchmarks point this at a local stub.
+YAHOO_URL = get_setting("CINTEL_YAHOO_URL", "https://query1.finance.yahoo.com")
+
+# "batch" asks for many tickers per request; "single" asks for one at a time.
+STOCK_FETCH_MODE = get_setting("CINTEL_STOCK_FETCH_MODE", "batch")
+
+# Most tickers and URL length per quote request.
+QUOTE_BATCH_SIZE = get_setting("CINTEL_QUOTE_BATCH_SIZE", 100, int)
+QUOTE_MAX_URL_LENGTH = 2000
+
+# Only these fields are returned by the quote endpoint.
+QUOTE_FIELDS = "symbol,regularMarketPrice"
+
+# Statuses meaning the request was too large; the chunk is split in two.
+TOO_LARGE_STATUSES = {400, 413, 414, 431}
+
+# Identical price requests within the TTL share one upstream call.
+stock_cache = AsyncTTLCache(
+    "stock",
+    ttl=get_setting("CINTEL_STOCK_CACHE_TTL", 15, float),
+    max_size=get_setting("CINTEL_CACHE_SIZE", 1024, int),
+    stale_ttl=get_setting("CINTEL_STOCK_STALE_TTL", 120, float),
+)
+
+
+# Which price was stored last per company; one is never stored twice.
+new_readings = NewReadings(stock_cache)
+
+
+async def get_stock_price(ticker, max_age=None):
+    """Return the latest price of ticker (cached; see util_cache)."""
+    return await stock_cache.get(ticker, lambda: fetch_stock_price(ticker), max_age)
+
+
+async def get_stock_prices(tickers, max_age=None):
+    """Return the latest prices of many tickers (cached; see util_cache).
+    @param max_age: refetch prices older than this many seconds.
+    @returns: ({ticker: price}, {ticker: exception}).
+    """
+    return await stock_cache.get_many(tickers, fetch_stock_prices, max_age)
+
+
+def quote_url(tickers):
+    symbols = ",".join(quote(ticker, safe="-.^=") for ticker in tickers)
+    return f"{YAHOO_URL}/v7/finance/quote?symbols={symbols}&fields={QUOTE_FIELDS}"
+
+
+def chunk_tickers(tickers, max_tickers=None, max_url_length=QUOTE_MAX_URL_LENGTH):
+    """Split tickers into lists small enough for one quote request each."""
+    if max_tickers is None:
+        max_tickers = QUOTE_BATCH_SIZE
+    chunk = []
+    for ticker in tickers:
+        if chunk and (
+            len(chunk) >= max_tickers or len(quote_url(chunk + [ticker])) > max_url_length
+        ):
+            yield chunk
+            chunk = []
+        chunk.append(ticker)
+    if chunk:
+        yield chunk
+
+
+def parse_quotes(data):
+    """Return {symbol: price} from a quote response, skipping symbols without a price."""
+    prices = {}
+    for item in data["quoteResponse"]["result"]:
+        price = item.get("regularMarketPrice")
+        if price is not None:
+            prices[item["symbol"]] = price
+    return prices
+
+
+async def fetch_stock_prices(tickers):
+    """Return {ticker: price}, one quote request per chunk of tickers.
+
+    Tickers of a chunk that fails are fetched one by one instead, unless the
+    upstream is rate limiting us.
+    """
+    chunks = [tuple(chunk) for chunk in chunk_tickers(tickers)]
+    batch = await fetch_batch(chunks, fetch_quote_chunk)
+    prices = {}
+    for result in batch.results.values():
+        prices.update(result)
+    limited = rate_limit(batch.errors)
+    if limited is not None:
+        # One request per ticker would only make it worse; wait instead.
+        if not prices:
+            raise limited  # for every ticker, so the scheduler backs off
+        return prices
+    if batch.errors:
+        failed = [ticker for chunk in batch.errors for ticker in chunk]
+        logger.warning("Quote requests failed; fetching %d tickers one by one", len(failed))
+        singles = await fetch_batch(failed, fetch_stock_price)
+        prices.update(singles.results)
+    return prices
+
+
+@timed("fetch", source="stock")
+async def fetch_quote_chunk(tickers):
+    """Return {ticker: price} for one chunk, splitting it if it is too large."""
+    logger.info("Calling quote endpoint for %d tickers", len(tickers))
+    result = await fetch_from_url(quote_url(tickers), "json")
+    if result.status in TOO_LARGE_STATUSES and len(tickers) > 1:
+        half = len(tickers) // 2
+        logger.info("Quote request too large (HTTP %d); splitting", result.status)
+        first, second = await asyncio.gather(
+            fetch_quote_chunk(tickers[:half]), fetch_quote_chunk(tickers[half:])
+        )
+        return {**first, **second}
+    check_status(result, "Quote request")
+    return parse_quotes(result.data)
+
+
+@timed("fetch", source="stock")
+async def fetch_stock_price(ticker):
+    logger.info("Calling get_stock_price for %s", ticker)
+    stock_api_url = f"{YAHOO_URL}/v7/finance/options/{ticker}"
+    logger.debug("Calling fetch_from_url for %s", stock_api_url)
     result = await fetch_from_url(stock_api_url, "json")
-    logger.info(f"Data from yahoo finance: {result}")
+    check_status(result, "Price request")
+    logger.debug("Data from yahoo finance: %s", result.data)
     price = result.data["optionChain"]["result"][0]["quote"]["regularMarketPrice"]
     return price
 
 
-def init_stock_csv_file(file_path):
-    df_empty = pd.DataFrame(
-        columns=["Company", "Ticker", "Time", "Price"]
-        )
-    df_empty.to_csv(file_path, index=False)
+# Seconds between polls of every company, and of those sessions are viewing.
+POLL_INTERVAL = get_setting("CINTEL_STOCK_INTERVAL", 60, float)
+VIEWED_INTERVAL = get_setting("CINTEL_STOCK_VIEWED_INTERVAL", 20, float)
+
+# Keep the most recent prices (rows, across all companies) between cycles,
+# with room for the extra rows of the viewed companies on top.
+num_updates = get_setting("CINTEL_STOCK_HISTORY", 50, int)
+capacity = num_updates * (1 + viewed_polls(POLL_INTERVAL, VIEWED_INTERVAL))
+
+COLUMNS = {"Company": "category", "Ticker": "category", "Time": "time", "Price": "float"}
+
+# Sessions read from the in-memory store; the storage backend persists it.
+base_path = Path(__file__).parent.joinpath("data").joinpath("reactive_stock")
+storage = make_backend(
+    get_setting("CINTEL_STORAGE_BACKEND", "csv"), base_path, COLUMNS, capacity
+)
+
+store = TimeSeriesStore(COLUMNS, capacity=capacity, loader=storage.load)
+
+# Rolling statistics and alerts, updated as rows arrive (see app.py).
+analytics = RollingAnalytics("Company", "Price", thresholds=entities.companies.thresholds())
+
+
+async def update_csv_stock(names=None):
+    """Fetch the latest prices once and update the store and storage.
 
+    Every company in the registry (util_entities) is fetched
+    concurrently; a ticker that fails is skipped for this cycle, and one
+    whose cached price was already stored is left out. A poll with no new
+    prices because the upstream failed (e.g. rate limited) raises its error,
+    so the scheduler backs off.
 
-async def update_csv_stock():
+    The ingestion scheduler calls this once per poll interval, and with
+    names more often for the companies that sessions are viewing.
+    @param names: fetch only these companies; None fetches every one.
+    @returns: the list of new records.
+    """
     logger.info("Calling update_csv_stock")
-    try:
-        companies = [
-        "Nordstrom Inc",
-        "Lululemon Athletica Inc",
-        "Starbucks Corporation",
-        "NIKE Inc",
-        "Amazon.com Inc",
-        ]
-        update_interval = 60
-        total_runtime = 15 * 60
-        num_updates = 50
-        logger.info(f"update_interval: {update_interval}")
-        logger.info(f"total_runtime: {total_runtime}")
-        logger.info(f"num_updates: {num_updates}")
-
-        records_deque = deque(maxlen=num_updates)
-
-        fp = Path(__file__).parent.joinpath("data").joinpath("reactive_stock.csv")
-
-        if not os.path.exists(fp):
-            init_stock_csv_file(fp)
-
-        logger.info(f"Initialized csv file at {fp}")
-
-        for _ in range(num_updates):
-            for company in companies:
-                ticker = lookup_ticker(company)
-                new_price = await get_stock_price(ticker)
-                time_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current time
-                new_record = {
-                    "Company": company,
-                    "Ticker": ticker,
-                    "Time": time_now,
-                    "Price": new_price,
-                }
-                records_deque.append(new_record)
-
-            df = pd.DataFrame(records_deque)
-
-            df.to_csv(fp, index=False, mode="w")
-            logger.info(f"Saving prices to {fp}")
-
-            await asyncio.sleep(update_interval)
-
-    except Exception as e:
-        logger.error(f"ERROR in update_csv_stock: {e}")
\ No newline at end of file
+    if names is None:
+        names = entities.companies.names
+        max_age = None
+    else:
+        names = [name for name in names if name in entities.companies]
+        max_age = VIEWED_INTERVAL / 4  # fresher than the cache would keep them
+
+    if STOCK_FETCH_MODE == "single":
+
+        async def fetch_company(company):
+            return await get_stock_price(lookup_ticker(company), max_age)
+
+        batch = await fetch_batch(names, fetch_company)
+        prices, errors = batch.results, batch.errors
+    else:
+        by_ticker = {lookup_ticker(company): company for company in names}
+        ticker_prices, errors = await get_stock_prices(list(by_ticker), max_age)
+        prices = {by_ticker[ticker]: price for ticker, price in ticker_prices.items()}
+    if errors:
+        logger.warning("No price for %d of %d companies", len(errors), len(names))
+    prices, stale = new_readings.select(prices, lookup_ticker)
+    if stale:
+        logger.warning("Only stale prices for %d companies", len(stale))
+    if not prices:
+        # Nothing new is a failed poll if the upstream failed, e.g. rate limited.
+        errors = {**errors, **stale}
+        if errors:
+            raise rate_limit(errors) or RuntimeError(f"No new prices; {len(errors)} errors")
+        logger.info("No new prices since the last poll")
+        return []
+
+    time_now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")  # Current time
+    new_records = []
+    for company, new_price in prices.items():
+        ticker = lookup_ticker(company)
+        new_record = {
+            "Company": company,
+            "Ticker": ticker,
+            "Time": time_now,
+            "Price": new_price,
+        }
+        new_records.append(new_record)
+
+    with timer("write", source="stock"):
+        store.append(new_records)
+        storage.save(new_records)
+    logger.info("Saving prices with the %s backend", storage.name)
+    logger.info("Stock cache: %s", stock_cache.stats())
+    return new_records
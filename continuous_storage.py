@@ -0,0 +1,423 @@
+"""
+Purpose: Persist the continuous data incrementally and safely.
+
+Each poll cycle appends only its new rows to the CSV file in a single write.
+The file may grow up to compact_factor times the retention window; it is then
+compacted back to the window by writing a temporary file and renaming it over
+the old one. Readers therefore see either the old file or the new file, never
+a half-written one. read_csv_safely() also ignores an incomplete last line, in
+case a reader catches an append in progress.
+
+The data directory can use one of several storage backends, chosen with the
+CINTEL_STORAGE_BACKEND setting:
+
+- "csv": text files, as before (the default).
+- "parquet": typed, compressed columnar files (needs pyarrow).
+- "mmap": one memory-mapped binary file per column, in the same ring layout
+  as continuous_store.TimeSeriesStore. Appends write only the new rows, and
+  loading maps the files instead of parsing them. Other processes can read
+  the files while they are written (see MmapBackend.read).
+- "none": keep the data in memory only.
+
+A process that does not write the data itself can watch a backend's
+watch_path for changes and read() the rows again (see reactive_updates).
+
+Every backend loads typed columns: datetime64 Time, float values and
+categorical Location/Company. To convert existing CSV files once, run:
+
+    python continuous_storage.py migrate mmap
+"""
+
+import csv
+import io
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from continuous_store import COLUMN_DTYPES, TimeSeriesStore
+from util_logger import setup_logger
+
+logger, log_filename = setup_logger(__file__)
+
+BACKENDS = ("csv", "parquet", "mmap", "none")
+
+# Format of the Time column in CSV files.
+CSV_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# How many times MmapBackend.read() retries a read that overlapped a write.
+MMAP_READ_ATTEMPTS = 50
+
+
+class IncrementalCsvWriter:
+    """Append-only CSV writer that keeps the most recent max_rows rows.
+
+    Only the number of rows in the file is kept in memory; the retained rows
+    themselves live in the TimeSeriesStore. Compaction keeps the file's own
+    last max_rows lines, without parsing them.
+    """
+
+    def __init__(self, path, columns, max_rows, compact_factor=2):
+        self.path = path
+        self.columns = list(columns)
+        self.max_rows = max_rows
+        self.compact_factor = compact_factor
+        self.rows_in_file = 0
+        self._opened = False
+
+    def open(self):
+        """Count the rows of an existing file, or create the file."""
+        if self._opened:
+            return
+        self._opened = True
+        if os.path.exists(self.path):
+            lines = self._lines()
+            if lines and next(csv.reader([lines[0].decode("utf-8")])) == self.columns:
+                self.rows_in_file = len(lines) - 1
+                logger.info("Found %d rows in %s", self.rows_in_file, self.path)
+                if self.rows_in_file > self.max_rows:
+                    self.compact()
+                return
+            logger.info("Columns changed in %s; starting a new file", self.path)
+        self._rewrite([])
+
+    def append(self, new_records):
+        """Append new_records (a list of dicts) to the file."""
+        self.open()
+        if not new_records:
+            return
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=self.columns, lineterminator="\n")
+        writer.writerows(new_records)
+        data = buffer.getvalue().encode("utf-8")
+
+        if self.rows_in_file + len(new_records) > self.max_rows * self.compact_factor:
+            self.compact(data)
+            return
+
+        # One write() on an O_APPEND descriptor, so rows land together.
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        self.rows_in_file += len(new_records)
+
+    def compact(self, new_rows=b""):
+        """Rewrite the file with only its most recent rows, atomically.
+        @param new_rows: encoded rows to add at the end first.
+        """
+        rows = self._lines()[1:] + new_rows.splitlines(keepends=True)
+        self._rewrite(rows[-self.max_rows :])
+        logger.info("Compacted %s to %d rows", self.path, self.rows_in_file)
+
+    def _lines(self):
+        """Return the complete lines of the file, header first, as bytes."""
+        with open(self.path, "rb") as file:
+            data = file.read()
+        return data[: data.rfind(b"\n") + 1].splitlines(keepends=True)
+
+    def _rewrite(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerow(self.columns)
+        write_atomically(self.path, buffer.getvalue().encode("utf-8") + b"".join(rows))
+        self.rows_in_file = len(rows)
+
+
+def write_atomically(path, data):
+    """Write data (bytes) to a temporary file, then rename it over path."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_csv_safely(path, max_rows=None):
+    """Read a CSV file written by IncrementalCsvWriter.
+    @param max_rows: if given, return only the most recent max_rows rows.
+    @returns: a DataFrame without any incomplete trailing line.
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    end = data.rfind(b"\n")
+    data = data[: end + 1] if end >= 0 else b""
+    if not data:
+        return pd.DataFrame()
+    df = pd.read_csv(io.BytesIO(data))
+    if max_rows is not None and len(df) > max_rows:
+        df = df.iloc[-max_rows:].reset_index(drop=True)
+    return df
+
+
+def read_csv_typed(path, columns, max_rows=None):
+    """Read a CSV file safely and convert it to the column kinds of a store.
+    @param columns: dict of column name to kind, as for TimeSeriesStore.
+    """
+    df = read_csv_safely(path, max_rows=max_rows)
+    if df.empty:
+        return pd.DataFrame({name: [] for name in columns})
+    return as_typed_frame(df, columns)
+
+
+def as_typed_frame(df, columns):
+    """Return df with datetime64, float and categorical columns."""
+    typed = {}
+    for name, kind in columns.items():
+        if kind == "category":
+            typed[name] = df[name].astype("category")
+        elif kind == "time":
+            typed[name] = pd.to_datetime(df[name], format=CSV_TIME_FORMAT)
+        else:
+            typed[name] = df[name].astype(COLUMN_DTYPES[kind])
+    return pd.DataFrame(typed)
+
+
+class CsvBackend:
+    """Text CSV files, appended to incrementally."""
+
+    name = "csv"
+
+    def __init__(self, base_path, columns, max_rows):
+        self.columns = dict(columns)
+        self.max_rows = max_rows
+        self.path = Path(f"{base_path}.csv")
+        self.writer = IncrementalCsvWriter(self.path, self.columns, max_rows)
+        self.watch_path = self.path
+
+    def load(self):
+        """Return the persisted rows as a typed DataFrame."""
+        if not self.path.exists():
+            return pd.DataFrame({name: [] for name in self.columns})
+        return read_csv_typed(self.path, self.columns, max_rows=self.max_rows)
+
+    def read(self):
+        """Return the rows on disk now, e.g. after another process wrote them."""
+        return self.load()
+
+    def save(self, new_records):
+        self.writer.append(new_records)
+
+    def write_frame(self, df):
+        """Replace the file with the rows of a typed DataFrame."""
+        df = df.iloc[-self.max_rows :].copy()
+        for name, kind in self.columns.items():
+            if kind == "time":
+                df[name] = df[name].dt.strftime(CSV_TIME_FORMAT)
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, lineterminator="\n")
+        write_atomically(self.path, buffer.getvalue().encode("utf-8"))
+
+
+class ParquetBackend:
+    """One typed, compressed Parquet file, rewritten atomically each cycle."""
+
+    name = "parquet"
+
+    def __init__(self, base_path, columns, max_rows):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError("The parquet storage backend needs pyarrow installed")
+        self.columns = dict(columns)
+        self.max_rows = max_rows
+        self.path = Path(f"{base_path}.parquet")
+        self.watch_path = self.path
+        self.store = TimeSeriesStore(self.columns, max_rows, loader=self._read)
+
+    def _read(self):
+        if not self.path.exists():
+            return []
+        return pd.read_parquet(self.path)
+
+    def load(self):
+        return self.store.frame()
+
+    def read(self):
+        """Return the rows on disk now, e.g. after another process wrote them."""
+        if not self.path.exists():
+            return pd.DataFrame({name: [] for name in self.columns})
+        return pd.read_parquet(self.path)
+
+    def save(self, new_records):
+        self.store.append(new_records)
+        self.write_frame(self.store.frame())
+
+    def write_frame(self, df):
+        buffer = io.BytesIO()
+        df.iloc[-self.max_rows :].to_parquet(buffer, index=False)
+        write_atomically(self.path, buffer.getvalue())
+
+
+class MmapBackend:
+    """Memory-mapped column files in the TimeSeriesStore ring layout.
+
+    The directory holds one raw binary file per column plus meta.json with
+    the row count, version and categories. Only the new rows are written on
+    each save; meta.json is replaced atomically afterwards.
+
+    seq.bin holds a sequence number (a seqlock) so that other processes read
+    consistent rows: it is odd while a save is in progress and goes up again
+    when it is done. A reader that sees it odd, or changed by the time it has
+    copied the rows, reads again.
+    """
+
+    name = "mmap"
+
+    def __init__(self, base_path, columns, max_rows):
+        self.columns = dict(columns)
+        self.max_rows = max_rows
+        self.directory = Path(f"{base_path}.mmap")
+        self.meta_path = self.directory.joinpath("meta.json")
+        self.watch_path = self.meta_path  # replaced after every save
+        self.store = None
+        self.seq = None
+
+    def _open(self):
+        if self.store is not None:
+            return self.store
+        state = None
+        if self.meta_path.exists():
+            meta = json.loads(self.meta_path.read_text())
+            if meta["capacity"] == self.max_rows and meta["columns"] == self.columns:
+                state = meta
+            else:
+                logger.info("Layout changed in %s; starting over", self.directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        mode = "r+" if state is not None else "w+"
+        arrays = {
+            name: np.memmap(
+                self.directory.joinpath(f"{name}.bin"),
+                dtype=COLUMN_DTYPES[kind],
+                mode=mode,
+                shape=(2 * self.max_rows,),
+            )
+            for name, kind in self.columns.items()
+        }
+        seq_path = self.directory.joinpath("seq.bin")
+        self.seq = np.memmap(
+            seq_path, dtype=np.int64, mode="r+" if seq_path.exists() else "w+", shape=(1,)
+        )
+        self.store = TimeSeriesStore(
+            self.columns, self.max_rows, arrays=arrays, state=state
+        )
+        return self.store
+
+    def load(self):
+        """Return the persisted rows; column data is paged in only when read."""
+        return self._open().frame()
+
+    def read(self):
+        """Return the rows on disk now, e.g. after another process wrote them.
+
+        Returns a copy of the rows of the last complete save, checked
+        against seq.bin. Until the writer has saved with this layout, there
+        is nothing to read (and nothing is created or overwritten).
+        """
+        empty = pd.DataFrame({name: [] for name in self.columns})
+        for _ in range(MMAP_READ_ATTEMPTS):
+            if not self.meta_path.exists():
+                return empty
+            meta = json.loads(self.meta_path.read_text())
+            if meta["capacity"] != self.max_rows or meta["columns"] != self.columns:
+                return empty
+            if self.seq is None:
+                self._open()  # map the files once; they follow the writer's saves
+            seq = int(self.seq[0])
+            if seq % 2:
+                time.sleep(0.001)  # a save is in progress
+                continue
+            meta = json.loads(self.meta_path.read_text())  # the last complete save
+            self.store = TimeSeriesStore(
+                self.columns, self.max_rows, arrays=self.store._arrays, state=meta
+            )
+            df = self.store.frame().copy()
+            if int(self.seq[0]) == seq:
+                return df
+        raise RuntimeError(f"{self.directory} kept changing while being read")
+
+    def save(self, new_records):
+        store = self._open()
+        self._begin()
+        store.append(new_records)
+        self._commit(store)
+
+    def write_frame(self, df):
+        """Replace the rows on disk with those of a typed DataFrame."""
+        store = self._open()
+        self._begin()
+        store.replace_frame(df)
+        self._commit(store)
+
+    def _begin(self):
+        # Odd while saving. Still odd if a writer died mid-save; keep it so.
+        self.seq[0] += 1 - self.seq[0] % 2
+
+    def _commit(self, store):
+        for array in store._arrays.values():
+            array.flush()
+        meta = store.state()
+        meta["capacity"] = self.max_rows
+        meta["columns"] = self.columns
+        write_atomically(self.meta_path, json.dumps(meta).encode("utf-8"))
+        self.seq[0] += 1  # even again: this save is complete
+
+
+class NoBackend:
+    """Keep the data in memory only."""
+
+    name = "none"
+
+    def __init__(self, base_path, columns, max_rows):
+        self.columns = dict(columns)
+        self.watch_path = None  # nothing on disk to watch
+
+    def load(self):
+        return pd.DataFrame({name: [] for name in self.columns})
+
+    def read(self):
+        return self.load()
+
+    def save(self, new_records):
+        pass
+
+
+def make_backend(kind, base_path, columns, max_rows):
+    """Return the storage backend called kind for one data source.
+    @param base_path: the path without extension, e.g. data/reactive_stock.
+    """
+    backends = {
+        "csv": CsvBackend,
+        "parquet": ParquetBackend,
+        "mmap": MmapBackend,
+        "none": NoBackend,
+    }
+    if kind not in backends:
+        raise ValueError(f"Unknown storage backend {kind!r}; use one of {BACKENDS}")
+    return backends[kind](base_path, columns, max_rows)
+
+
+def migrate_csv(source, target_kind):
+    """Copy the CSV data of one source (a continuous_* module) to another backend."""
+    csv_backend = CsvBackend(source.base_path, source.COLUMNS, source.capacity)
+    df = csv_backend.load()
+    target = make_backend(target_kind, source.base_path, source.COLUMNS, source.capacity)
+    target.write_frame(df)
+    logger.info(f"Migrated {len(df)} rows from {csv_backend.path} to {target_kind}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "migrate" or sys.argv[2] not in ("parquet", "mmap"):
+        print("Usage: python continuous_storage.py migrate parquet|mmap")
+        sys.exit(2)
+
+    import continuous_location
+    import continuous_stock
+
+    for source in (continuous_location, continuous_stock):
+        migrate_csv(source, sys.argv[2])
@@ -0,0 +1,282 @@
+"""
+Purpose: Keep the recent continuous data in memory, once per process.
+
+Each TimeSeriesStore is a columnar ring buffer: one NumPy array per column,
+with text columns (such as Location or Company) stored as integer codes.
+Every row is written twice, at position i and i + capacity, so the most recent
+rows always form one contiguous slice and can be read without copying.
+
+The ingestion loop appends to the store and every session reads from it.
+append() encodes a poll's records a column at a time, looking up each
+distinct entity and time once. A row costs 4 or 8 bytes per column (twice,
+with the copy) instead of a dict of Python objects.
+A version counter goes up on every append; sessions compare it to decide
+whether their outputs are out of date. frame() builds one DataFrame per
+version, a view over the arrays that copies only the category codes, and
+shares it between all sessions, so the cost of an update does not depend on
+how many sessions are open.
+
+select() returns the rows for a selection of entities (e.g. locations).
+It uses a per-entity index built once per version, and remembers recent
+results, so the table and the chart of every session share one selection.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from util_logger import setup_logger
+
+logger, log_filename = setup_logger(__file__)
+
+# Column kinds and the NumPy dtype used to hold them.
+COLUMN_DTYPES = {
+    "category": np.int32,  # index into the column's list of categories
+    "float": np.float64,
+    "time": np.int64,  # nanoseconds since the epoch
+}
+
+# Most selections remembered per version by select().
+MAX_SELECTIONS = 64
+
+
+class TimeSeriesStore:
+    """Fixed-capacity, columnar ring buffer of the most recent rows."""
+
+    def __init__(self, columns, capacity, loader=None, arrays=None, state=None):
+        """
+        @param columns: dict of column name to kind ("category", "float" or "time").
+        @param capacity: the number of most recent rows to keep.
+        @param loader: optional function returning a DataFrame (or a list of
+        records) to load the first time the store is used, e.g. rows persisted
+        by a storage backend.
+        @param arrays: optional dict of column name to an existing array of
+        length 2 * capacity to use as the buffer, e.g. a np.memmap.
+        @param state: optional dict from state() restoring the row count,
+        version and categories that go with those arrays.
+        """
+        self.columns = dict(columns)
+        self.capacity = capacity
+        self.version = 0
+        self._loader = loader
+        if arrays is None:
+            arrays = {
+                name: np.zeros(2 * capacity, dtype=COLUMN_DTYPES[kind])
+                for name, kind in self.columns.items()
+            }
+        self._arrays = arrays
+        self._categories = {
+            name: [] for name, kind in self.columns.items() if kind == "category"
+        }
+        self._written = 0  # rows appended since creation
+        if state is not None:
+            self._written = state["written"]
+            self.version = state["version"]
+            for name, values in state["categories"].items():
+                self._categories[name] = list(values)
+        self._category_codes = {
+            name: {value: code for code, value in enumerate(values)}
+            for name, values in self._categories.items()
+        }
+        self._frame = None
+        self._frame_version = -1
+        self._indexes = {}  # column -> {code: row positions}, for this version
+        self._selections = OrderedDict()  # (column, selection) -> DataFrame
+        self._cache_version = -1
+
+    def __len__(self):
+        self._load()
+        return min(self._written, self.capacity)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the column buffers (both halves of the ring)."""
+        return sum(array.nbytes for array in self._arrays.values())
+
+    def state(self):
+        """Return the row count, version and categories, e.g. to persist them."""
+        return {
+            "written": self._written,
+            "version": self.version,
+            "categories": {name: list(v) for name, v in self._categories.items()},
+        }
+
+    def _load(self):
+        if self._loader is not None:
+            loader, self._loader = self._loader, None
+            rows = loader()
+            if isinstance(rows, pd.DataFrame):
+                self.extend_frame(rows)
+            else:
+                self.append(rows)
+            if len(rows):
+                logger.info(f"Loaded {len(rows)} rows into store")
+
+    def _encode(self, name, value):
+        kind = self.columns[name]
+        if kind == "category":
+            codes = self._category_codes[name]
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(self._categories[name])
+                self._categories[name].append(value)
+            return code
+        if kind == "time":
+            return pd.Timestamp(value).value
+        return value
+
+    def append(self, records):
+        """Append records (a list of dicts with every column) and bump the version."""
+        self._load()
+        if not records:
+            return
+        # Only the last `capacity` records can survive this append.
+        skipped = max(0, len(records) - self.capacity)
+        records = records[skipped:]
+        encoded = {
+            name: self._encode_values(name, [record[name] for record in records])
+            for name in self.columns
+        }
+        self._write(encoded, len(records), skipped)
+
+    def extend_frame(self, df):
+        """Append every row of df at once (vectorized) and bump the version."""
+        self._load()
+        if len(df) == 0:
+            return
+        skipped = max(0, len(df) - self.capacity)
+        if skipped:
+            df = df.iloc[skipped:]
+        encoded = {name: self._encode_column(name, df[name]) for name in self.columns}
+        self._write(encoded, len(df), skipped)
+
+    def _write(self, encoded, rows, skipped):
+        """Write rows of encoded column values after skipping skipped rows."""
+        capacity = self.capacity
+        self._written += skipped
+        positions = (self._written + np.arange(rows)) % capacity
+        for name, array in self._arrays.items():
+            values = encoded[name]
+            array[positions] = values
+            array[positions + capacity] = values
+        self._written += rows
+        self.version += 1
+
+    def replace_frame(self, df):
+        """Replace every retained row with those of df and bump the version.
+
+        Used when another process wrote the rows (see reactive_updates).
+        """
+        self._loader = None
+        self._written = 0
+        if len(df):
+            self.extend_frame(df)
+        else:
+            self.version += 1
+
+    def _encode_values(self, name, values):
+        """Encode one column of records, each distinct category or time once."""
+        kind = self.columns[name]
+        dtype = COLUMN_DTYPES[kind]
+        if kind == "float":
+            return np.asarray(values, dtype=dtype)
+        # A poll repeats its entities and shares one time; look each up once.
+        lookup = {value: self._encode(name, value) for value in dict.fromkeys(values)}
+        return np.fromiter(map(lookup.__getitem__, values), dtype=dtype, count=len(values))
+
+    def _encode_column(self, name, series):
+        kind = self.columns[name]
+        if kind == "category":
+            categorical = pd.Categorical(series)
+            lookup = np.array(
+                [self._encode(name, value) for value in categorical.categories],
+                dtype=np.int32,
+            )
+            return lookup[categorical.codes]
+        if kind == "time":
+            times = pd.to_datetime(series).to_numpy().astype("datetime64[ns]")
+            return times.view(np.int64)
+        return series.to_numpy(dtype=COLUMN_DTYPES[kind])
+
+    def view(self, name):
+        """Return the retained values of one column, oldest first, without copying."""
+        self._load()
+        n = min(self._written, self.capacity)
+        start = (self._written - n) % self.capacity
+        return self._arrays[name][start : start + n]
+
+    def categories(self, name):
+        """Return every value seen so far in a category column."""
+        return list(self._categories[name])
+
+    def frame(self):
+        """Return the retained rows as a DataFrame, shared until the next append.
+
+        Callers must treat the result as read-only.
+        """
+        self._load()
+        if self._frame_version != self.version:
+            data = {}
+            for name, kind in self.columns.items():
+                values = self.view(name)
+                if kind == "category":
+                    values = pd.Categorical.from_codes(
+                        values, categories=self._categories[name]
+                    )
+                elif kind == "time":
+                    values = values.view("datetime64[ns]")
+                data[name] = values
+            self._frame = pd.DataFrame(data, copy=False)
+            self._frame_version = self.version
+        return self._frame
+
+    def _index(self, name):
+        """Return {code: row positions} for a category column, built once per version."""
+        if self._cache_version != self.version:
+            self._indexes.clear()
+            self._selections.clear()
+            self._cache_version = self.version
+        index = self._indexes.get(name)
+        if index is None:
+            codes = self.view(name)
+            order = np.argsort(codes, kind="stable")
+            sorted_codes = codes[order]
+            starts = np.flatnonzero(np.diff(sorted_codes, prepend=-1))
+            ends = np.append(starts[1:], len(order))
+            index = {
+                int(sorted_codes[start]): order[start:end]
+                for start, end in zip(starts, ends)
+            }
+            self._indexes[name] = index
+        return index
+
+    def select(self, name, selected):
+        """Return the rows whose category column name is one of selected.
+
+        The work done depends on the number of rows selected, not on the
+        number of rows retained. Results are shared until the next append;
+        callers must treat them as read-only.
+        """
+        self._load()
+        if isinstance(selected, str):
+            selected = (selected,)
+        key = (name, tuple(sorted(selected)))
+        index = self._index(name)
+        df = self._selections.get(key)
+        if df is not None:
+            self._selections.move_to_end(key)
+            return df
+
+        codes = self._category_codes[name]
+        parts = [index[codes[value]] for value in key[1] if codes.get(value) in index]
+        if parts:
+            positions = np.sort(np.concatenate(parts))
+        else:
+            positions = np.array([], dtype=np.int64)
+        df = self.frame().iloc[positions]
+
+        self._selections[key] = df
+        if len(self._selections) > MAX_SELECTIONS:
+            self._selections.popitem(last=False)
+        return df
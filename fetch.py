@@ -2,22 +2,72 @@
 Purpose: Provide a simple async wrapper for http requests that works in both regular
 Python and Pyodide (on your machine and in the browser, respectively).
 
+In regular Python, requests go through one shared, pooled aiohttp session so that
+connections to each host are kept alive and reused, every request has a timeout,
+the number of requests in flight is bounded, and transient failures are retried
+with exponential backoff. A 429 (rate limited) is returned at once, with its
+Retry-After, for the caller to wait out (see continuous_scheduler). None of
+this blocks the event loop that Shiny runs on.
+
 Source: https://shinylive.io/py/examples/#fetch-data-from-a-web-api
 File: download.py
 """
 
+import asyncio
 import json
-from typing import Any, Literal
+import random
+from typing import Any, Literal, Optional
+
+# Defaults for the regular Python (non-Pyodide) client.
+DEFAULT_TIMEOUT = 10.0  # seconds for the whole request, including reading the body
+DEFAULT_RETRIES = 2  # retries after the first attempt
+DEFAULT_BACKOFF = 0.5  # seconds; doubled after every failed attempt
+MAX_CONCURRENCY = 16  # requests in flight at once, across all hosts
+MAX_CONNECTIONS_PER_HOST = 8  # pooled keep-alive connections per host
+KEEPALIVE_TIMEOUT = 30.0  # seconds an idle pooled connection is kept open
+
+# Statuses worth retrying: transient server errors. A 429 is not retried here;
+# waiting out its Retry-After would hold a request slot and the poll.
+RETRY_STATUSES = {500, 502, 503, 504}
+
+# Optional object that records or replays responses instead (see continuous_replay).
+_tap = None
+
+# One client per event loop, created on first use.
+_client_session = None
+_client_loop = None
+_semaphore = None
+_semaphore_loop = None
 
 
 class HttpResponse:
-    def __init__(self, status: int, data: Any):
+    def __init__(self, status: int, data: Any, retry_after: Optional[float] = None):
         self.status = status
         self.data = data
+        self.retry_after = retry_after  # seconds, from a Retry-After header
+
+
+class RateLimitedError(RuntimeError):
+    """The upstream answered 429 Too Many Requests."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def check_status(response: HttpResponse, what: str) -> None:
+    """Raise unless the response is a 200; RateLimitedError for a 429."""
+    if response.status == 429:
+        raise RateLimitedError(f"{what} was rate limited (HTTP 429)", response.retry_after)
+    if response.status != 200:
+        raise RuntimeError(f"{what} failed with HTTP {response.status}")
 
 
 async def fetch_from_url(
-    url: str, type: Literal["string", "bytes", "json"] = "string"
+    url: str,
+    type: Literal["string", "bytes", "json"] = "string",
+    timeout: Optional[float] = None,
+    retries: Optional[int] = None,
 ) -> HttpResponse:
     """
     An async wrapper function for http requests that works in both regular Python and
@@ -27,7 +77,9 @@ async def fetch_from_url(
     JavaScript fetch() function. pyfetch() is asynchronous, so this whole function must
     also be async.
 
-    In regular Python, it uses the urllib.request.urlopen() function.
+    In regular Python, it uses a shared aiohttp.ClientSession. If aiohttp is not
+    installed, it falls back to urllib.request.urlopen() run in a worker thread, so
+    the event loop is never blocked either way.
 
     Args:
         url: The URL to download.
@@ -37,6 +89,11 @@ async def fetch_from_url(
         parses the response as JSON, then converts it to a Python object, usually a
         dictionary or list.
 
+        timeout: Seconds allowed for each attempt. Defaults to DEFAULT_TIMEOUT.
+
+        retries: Retries after the first attempt on connection errors, timeouts
+        and RETRY_STATUSES. Defaults to DEFAULT_RETRIES.
+
     Returns:
         A HttpResponse object
     """
@@ -60,14 +117,154 @@ async def fetch_from_url(
         return HttpResponse(response.status, data)
 
     else:
-        import urllib.request
+        if _tap is not None:
+            return await _tap.fetch(
+                url, type, lambda: _fetch_with_retries(url, type, timeout, retries)
+            )
+        return await _fetch_with_retries(url, type, timeout, retries)
 
-        response = urllib.request.urlopen(url)
-        if type == "json":
-            data = json.loads(response.read().decode("utf-8"))
-        elif type == "string":
-            data = response.read().decode("utf-8")
-        elif type == "bytes":
-            data = response.read()
 
-        return HttpResponse(response.status, data)
+def set_tap(tap) -> None:
+    """Route regular-Python requests through tap.fetch(url, type, fetch_live),
+    e.g. to record or replay them; None restores direct requests."""
+    global _tap
+    _tap = tap
+
+
+async def _fetch_with_retries(
+    url: str, type: str, timeout: Optional[float], retries: Optional[int]
+) -> HttpResponse:
+    if timeout is None:
+        timeout = DEFAULT_TIMEOUT
+    if retries is None:
+        retries = DEFAULT_RETRIES
+
+    try:
+        import aiohttp
+
+        fetch_once = _fetch_once_aiohttp
+        retry_errors = (aiohttp.ClientError, OSError, asyncio.TimeoutError)
+    except ImportError:
+        fetch_once = _fetch_once_urllib
+        retry_errors = (OSError, asyncio.TimeoutError)
+
+    attempt = 0
+    while True:
+        try:
+            # A slot per attempt; none is held while backing off.
+            async with _get_semaphore():
+                response, retry_after = await fetch_once(url, type, timeout)
+        except retry_errors:
+            if attempt >= retries:
+                raise
+            retry_after = None
+        else:
+            if response.status not in RETRY_STATUSES or attempt >= retries:
+                response.retry_after = retry_after
+                return response
+        await asyncio.sleep(_backoff_delay(attempt, retry_after, timeout))
+        attempt += 1
+
+
+def _backoff_delay(attempt: int, retry_after: Optional[float], timeout: float) -> float:
+    """Return the seconds to wait before the next attempt (with a little jitter),
+    at most timeout."""
+    delay = DEFAULT_BACKOFF * (2**attempt)
+    delay += random.uniform(0, DEFAULT_BACKOFF / 2)
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return min(delay, timeout)
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return a Retry-After header given in seconds, or None."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _decode(status: int, body: bytes, type: str) -> Any:
+    if status >= 400:
+        # Error bodies are often not what was asked for; never fail on them.
+        try:
+            return _decode(200, body, type)
+        except ValueError:
+            return body
+    if type == "json":
+        return json.loads(body.decode("utf-8"))
+    elif type == "string":
+        return body.decode("utf-8")
+    elif type == "bytes":
+        return body
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Return the semaphore bounding requests in flight on the running loop."""
+    global _semaphore, _semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _semaphore is None or _semaphore_loop is not loop:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+        _semaphore_loop = loop
+    return _semaphore
+
+
+def _bind_loop(loop) -> None:
+    """Forget the client of a previous event loop; it cannot be used on this one."""
+    global _client_loop, _client_session
+    if _client_loop is not loop:
+        _client_loop = loop
+        _client_session = None
+
+
+async def get_client_session():
+    """Return the shared aiohttp.ClientSession, creating it on first use."""
+    import aiohttp
+
+    global _client_session
+    _bind_loop(asyncio.get_running_loop())
+    if _client_session is None or _client_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=MAX_CONCURRENCY,
+            limit_per_host=MAX_CONNECTIONS_PER_HOST,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        _client_session = aiohttp.ClientSession(connector=connector)
+    return _client_session
+
+
+async def close_client_session() -> None:
+    """Close the shared client and its pooled connections (call on shutdown)."""
+    global _client_session
+    if _client_session is not None and not _client_session.closed:
+        await _client_session.close()
+    _client_session = None
+
+
+async def _fetch_once_aiohttp(url: str, type: str, timeout: float):
+    import aiohttp
+
+    session = await get_client_session()
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with session.get(url, timeout=client_timeout) as response:
+        body = await response.read()
+        retry_after = _parse_retry_after(response.headers.get("Retry-After"))
+        data = _decode(response.status, body, type)
+        return HttpResponse(response.status, data), retry_after
+
+
+async def _fetch_once_urllib(url: str, type: str, timeout: float):
+    return await asyncio.to_thread(_urlopen, url, type, timeout)
+
+
+def _urlopen(url: str, type: str, timeout: float):
+    import urllib.error
+    import urllib.request
+
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            data = _decode(response.status, response.read(), type)
+            return HttpResponse(response.status, data), None
+    except urllib.error.HTTPError as e:
+        retry_after = _parse_retry_after(e.headers.get("Retry-After"))
+        return HttpResponse(e.code, _decode(e.code, e.read(), type)), retry_after
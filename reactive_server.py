@@ -3,141 +3,337 @@ Purpose: Building on existing modules for final
 Author: Bambee Garfield
 """
 
-from pathlib import Path
-import pandas as pd
-import plotly.express as px
-from shiny import render, reactive
-from shinywidgets import render_widget
-import plotly.io as pio
-pio.templates.default = 'plotly_dark'
-
-from reactive_get_basics import get_reactive_df
+from shiny import render, reactive, req, ui
+from shinywidgets import register_widget, render_widget
+
+from continuous_location import POLL_INTERVAL as LOCATION_INTERVAL
+from continuous_location import analytics as location_analytics
+from continuous_location import num_updates as location_history
+from continuous_location import store as location_store
+from continuous_scheduler import scheduler
+from continuous_stock import POLL_INTERVAL as STOCK_INTERVAL
+from continuous_stock import analytics as stock_analytics
+from continuous_stock import num_updates as stock_history
+from continuous_stock import store as stock_store
+from reactive_charts import IncrementalLineChart
+from reactive_tables import table_html, visible_page
+from reactive_updates import updates
+from util_cache import RenderCache
+from util_config import get_setting
+from util_downsample import downsample_groups
+from util_entities import entities
 from util_logger import setup_logger
+from util_metrics import active_sessions, timed
 
 logger, logname = setup_logger(__name__)
 
-csv_locations = Path(__file__).parent.joinpath("data").joinpath("reactive_location.csv")
-csv_stocks = Path(__file__).parent.joinpath("data").joinpath("reactive_stock.csv")
+# "incremental" updates one FigureWidget per session in place;
+# "full" rebuilds a px.line figure on every change (plotly.express is only
+# imported in this mode).
+CHART_MODE = get_setting("CINTEL_CHART_MODE", "incremental")
+
+# Most points drawn per line, and how longer histories are reduced.
+CHART_MAX_POINTS = get_setting("CINTEL_CHART_MAX_POINTS", 500, int)
+LOCATION_DOWNSAMPLE = get_setting("CINTEL_LOCATION_DOWNSAMPLE", "lttb")
+STOCK_DOWNSAMPLE = get_setting("CINTEL_STOCK_DOWNSAMPLE", "ohlc")
+
+# Table pages, analytics tables, chart lines and figures, built once per data
+# version and selection and shared by every session showing them.
+render_cache = RenderCache("render", max_size=get_setting("CINTEL_RENDER_CACHE_SIZE", 256, int))
+
+
+def downsample_selection(df, entity_column, y_column, method):
+    """Return df with each entity reduced to at most CHART_MAX_POINTS points."""
+    return downsample_groups(df, entity_column, "Time", y_column, CHART_MAX_POINTS, method)
+
+
+def line_figure(df, entity_column, y_column, method, title):
+    """Build the px.line figure of the "full" chart mode."""
+    import plotly.express as px
+
+    df = downsample_selection(df, entity_column, y_column, method)
+    logger.debug("Rendering %s chart with %d points", y_column, len(df))
+    figure = px.line(df, x="Time", y=y_column, color=entity_column, markers=True)
+    figure.update_layout(title=title)
+    return figure
+
+
+def update_note(interval, history, entities):
+    """Describe how often a source is polled and how many of its rows are kept."""
+    return (
+        f"Updated every {interval:g} seconds.\n"
+        f"Keeps the most recent {history:,} readings across all {entities}."
+    )
 
 
 def get_reactive_server_functions(input, output, session):
     """Define functions to create UI outputs."""
 
 
-    reactive_location = reactive.Value("San Diego CA")
-    reactive_stock = reactive.Value("Norstrom Inc")
+    active_sessions.inc()
+    session.on_ended(active_sessions.dec)
+    # What this session shows is polled more often (see continuous_scheduler).
+    session.on_ended(lambda: scheduler.stop_viewing(session.id))
+
+    # The page only carries the default choices; offer the whole registry,
+    # searched on the server as the user types, keeping the selections.
+    with reactive.isolate():
+        initial_locations = entities.locations.validate(input.REACTIVE_LOCATION_SELECT())
+        initial_stocks = entities.companies.validate(input.REACTIVE_STOCK_SELECT())
+    ui.update_selectize(
+        "REACTIVE_LOCATION_SELECT",
+        choices=entities.locations.choices(),
+        selected=initial_locations,
+        server=True,
+    )
+    ui.update_selectize(
+        "REACTIVE_STOCK_SELECT",
+        choices=entities.companies.choices(),
+        selected=initial_stocks,
+        server=True,
+    )
 
-    reactive_df = reactive.Value()
-     
-    original_df = get_reactive_df()
-    total_count = len(original_df)
+    reactive_location = reactive.Value(initial_locations)
+    reactive_stock = reactive.Value(initial_stocks)
 
 ##Location Reactions
     @reactive.Effect
     @reactive.event(input.REACTIVE_LOCATION_SELECT)
     def _():
-        reactive_location.set(input.REACTIVE_LOCATION_SELECT())
-        df = get_reactive_temp_df()
-        logger.info(f"init reactive_temp_df len: {len(df)}")
+        reactive_location.set(selected_locations())
+        logger.info("Updated reactive_location selection: %s", reactive_location.get())
 
-    @reactive.file_reader(str(csv_locations))
+    @reactive.Effect
+    def _():
+        scheduler.set_viewing("location", session.id, selected_locations())
+
+    @updates.reader("location")
+    @timed("parse", source="location")
     def get_reactive_temp_df():
-        logger.info(f"READING df from {csv_locations}")
-        df = pd.read_csv(csv_locations)
-        logger.info(f"READING df len {len(df)}")
+        df = location_store.frame()
+        logger.debug("READING df len %d from location store", len(df))
         return df
 
+    @reactive.Calc
+    def selected_locations():
+        """The selected locations that are in the registry."""
+        return entities.locations.validate(input.REACTIVE_LOCATION_SELECT())
+
+    @reactive.Calc
+    def location_view():
+        """The data version and sorted selection; equal views render the same."""
+        get_reactive_temp_df()
+        return location_store.version, tuple(sorted(selected_locations()))
+
+    @reactive.Calc
+    @timed("filter", source="location")
+    def get_selected_temp_df():
+        """Rows for the selected locations, shared by the table and chart."""
+        get_reactive_temp_df()
+        return location_store.select("Location", selected_locations())
+
     @output
     @render.text
     def reactive_location_string():
         """Return a string based on selected location."""
-        logger.info("reactive_temperature_location_string starting")
-        selected = reactive_location.get()
+        logger.debug("reactive_temperature_location_string starting")
+        selected = ", ".join(reactive_location.get())
         line1 = f"Recent Temperature in F for {selected}."
-        line2 = "Updated once per minute for 15 minutes."
-        line3 = "Keeps the most recent 10 minutes of data."
-        message = f"{line1}\n{line2}\n{line3}"
-        logger.info(f"{message}")
+        message = f"{line1}\n{update_note(LOCATION_INTERVAL, location_history, 'locations')}"
+        logger.debug("%s", message)
         return message
 
+    # Only the page in view is rendered, and only when it changes.
+    location_page, location_page_info = visible_page(
+        input, "REACTIVE_LOCATION_TABLE", get_selected_temp_df, location_view, render_cache,
+        "location",
+    )
+
+    @output
+    @render.text
+    def reactive_location_table_info():
+        return location_page_info.get()
+
     @output
-    @render.table
+    @render.ui
+    @timed("render", output="reactive_location_table")
     def reactive_location_table():
-        df = get_reactive_temp_df()
-        selected_locations = input.REACTIVE_LOCATION_SELECT()
-        df_selected_locations = df[df["Location"].isin(selected_locations)]
-        logger.info(f"Rendering TEMP table with {len(df_selected_locations)} rows")
-        return df_selected_locations
+        html = location_page.get()
+        req(html is not None)
+        logger.debug("Rendering TEMP table page")
+        return ui.HTML(html)
+
+    if CHART_MODE == "incremental":
+        location_range = reactive.Value(None)
+        location_chart = IncrementalLineChart(
+            "Location",
+            "Temp_F",
+            "Continuous Temperature (F)",
+            max_points=CHART_MAX_POINTS,
+            method=LOCATION_DOWNSAMPLE,
+            on_range_change=location_range.set,
+            cache=render_cache,
+        )
+        register_widget("reactive_location_chart", location_chart.widget)
+
+        @reactive.Effect
+        @timed("render", output="reactive_location_chart")
+        def reactive_location_chart():
+            df_selected_locations = get_selected_temp_df()
+            location_range.get()  # redraw when the user zooms or pans
+            location_chart.update(df_selected_locations, selected_locations(), location_view())
+
+    else:
+
+        @output
+        @render_widget
+        @timed("render", output="reactive_location_chart")
+        def reactive_location_chart():
+            return render_cache.get(
+                ("location", "figure", location_view()),
+                lambda: line_figure(
+                    get_selected_temp_df(), "Location", "Temp_F", LOCATION_DOWNSAMPLE,
+                    "Continuous Temperature (F)",
+                ),
+            )
 
     @output
-    @render_widget
-    def reactive_location_chart():
-        df = get_reactive_temp_df()
-        selected_locations = input.REACTIVE_LOCATION_SELECT()
-        df_selected_locations = df[df["Location"].isin(selected_locations)]
-        logger.info(f"Rendering TEMP chart with {len(df_selected_locations)} points")
-        plotly_express_plot = px.line(
-            df_selected_locations, x="Time", y="Temp_F", color="Location", markers=True,
+    @render.ui
+    @timed("render", output="reactive_location_analytics")
+    def reactive_location_analytics():
+        """Rolling statistics and alerts for the selected locations."""
+        view = location_view()
+        location_analytics.refresh(location_store)  # already done unless polling
+        return ui.HTML(
+            render_cache.get(
+                ("location", "analytics", view),
+                lambda: table_html(location_analytics.snapshot(view[1])),
+            )
         )
-        plotly_express_plot.update_layout(title="Continuous Temperature (F)")
-        return plotly_express_plot
     
 ##Stock Reactions
     @reactive.Effect
     @reactive.event(input.REACTIVE_STOCK_SELECT)
     def _():
         """Set reactive_stock and update data when user changes selection"""
-        reactive_stock.set(input.REACTIVE_STOCK_SELECT())
-        df = get_reactive_stock_df()
-        logger.info(f"Updated reactive_stock selection: {reactive_stock.get()}. DataFrame length: {len(df)}")
+        reactive_stock.set(selected_stocks())
+        logger.info("Updated reactive_stock selection: %s", reactive_stock.get())
 
-    @reactive.file_reader(str(csv_stocks))
+    @reactive.Effect
+    def _():
+        scheduler.set_viewing("stock", session.id, selected_stocks())
+
+    @updates.reader("stock")
+    @timed("parse", source="stock")
     def get_reactive_stock_df():
-        logger.info(f"READING df from {csv_stocks}")
-        df = pd.read_csv(csv_stocks)
-        logger.info(f"READING df len {len(df)}")
+        df = stock_store.frame()
+        logger.debug("READING df len %d from stock store", len(df))
         return df
 
+    @reactive.Calc
+    def selected_stocks():
+        """The selected companies that are in the registry."""
+        return entities.companies.validate(input.REACTIVE_STOCK_SELECT())
+
+    @reactive.Calc
+    def stock_view():
+        """The data version and sorted selection; equal views render the same."""
+        get_reactive_stock_df()
+        return stock_store.version, tuple(sorted(selected_stocks()))
+
+    @reactive.Calc
+    @timed("filter", source="stock")
+    def get_selected_stock_df():
+        """Rows for the selected companies, shared by the table and chart."""
+        get_reactive_stock_df()
+        return stock_store.select("Company", selected_stocks())
+
     @output
     @render.text
     def reactive_stock_string():
-        logger.info("reactive_stock_string starting")
-        selected = reactive_stock.get()
+        logger.debug("reactive_stock_string starting")
+        selected = ", ".join(reactive_stock.get())
         line1 = f"Recent Price in USD for {selected}."
-        line2 = "Updated once per minute for 15 minutes."
-        line3 = "Keeps the most recent 10 minutes of data."
-        message = f"{line1}\n{line2}\n{line3}"
-        logger.info(message)
+        message = f"{line1}\n{update_note(STOCK_INTERVAL, stock_history, 'companies')}"
+        logger.debug("%s", message)
         return message
 
+    stock_page, stock_page_info = visible_page(
+        input, "REACTIVE_STOCK_TABLE", get_selected_stock_df, stock_view, render_cache, "stock"
+    )
+
+    @output
+    @render.text
+    def reactive_stock_table_info():
+        return stock_page_info.get()
+
     @output
-    @render.table
+    @render.ui
+    @timed("render", output="reactive_stock_table")
     def reactive_stock_table():
-        df = get_reactive_stock_df()
-        selected_stocks = input.REACTIVE_STOCK_SELECT()
-        df_selected_stocks = df[df["Company"].isin(selected_stocks)]
-        logger.info(f"Rendering price table with {len(df_selected_stocks)} rows")
-        return df_selected_stocks
+        html = stock_page.get()
+        req(html is not None)
+        logger.debug("Rendering price table page")
+        return ui.HTML(html)
+
+    if CHART_MODE == "incremental":
+        stock_range = reactive.Value(None)
+        stock_chart = IncrementalLineChart(
+            "Company",
+            "Price",
+            "Continuous Price (USD)",
+            max_points=CHART_MAX_POINTS,
+            method=STOCK_DOWNSAMPLE,
+            on_range_change=stock_range.set,
+            cache=render_cache,
+        )
+        register_widget("reactive_stock_chart", stock_chart.widget)
+
+        @reactive.Effect
+        @timed("render", output="reactive_stock_chart")
+        def reactive_stock_chart():
+            df_selected_stocks = get_selected_stock_df()
+            stock_range.get()  # redraw when the user zooms or pans
+            stock_chart.update(df_selected_stocks, selected_stocks(), stock_view())
+
+    else:
+
+        @output
+        @render_widget
+        @timed("render", output="reactive_stock_chart")
+        def reactive_stock_chart():
+            return render_cache.get(
+                ("stock", "figure", stock_view()),
+                lambda: line_figure(
+                    get_selected_stock_df(), "Company", "Price", STOCK_DOWNSAMPLE,
+                    "Continuous Price (USD)",
+                ),
+            )
 
     @output
-    @render_widget
-    def reactive_stock_chart():
-        df = get_reactive_stock_df()
-        selected_stocks = input.REACTIVE_STOCK_SELECT()
-        df_selected_stocks = df[df["Company"].isin(selected_stocks)]
-        logger.info(f"Rendering Price chart with {len(df_selected_stocks)} points")
-        plotly_express_plot = px.line(
-            df_selected_stocks, x="Time", y="Price", color="Company", markers=True
+    @render.ui
+    @timed("render", output="reactive_stock_analytics")
+    def reactive_stock_analytics():
+        """Rolling statistics and alerts for the selected companies."""
+        view = stock_view()
+        stock_analytics.refresh(stock_store)  # already done unless polling
+        return ui.HTML(
+            render_cache.get(
+                ("stock", "analytics", view),
+                lambda: table_html(stock_analytics.snapshot(view[1])),
+            )
         )
-        plotly_express_plot.update_layout(title="Continuous Price (USD)")
-        return plotly_express_plot
 
 
     return [
         reactive_location_string,
+        reactive_location_table_info,
         reactive_location_table,
         reactive_location_chart,
+        reactive_location_analytics,
         reactive_stock_string,
+        reactive_stock_table_info,
         reactive_stock_table,
         reactive_stock_chart,
+        reactive_stock_analytics,
     ]
\ No newline at end of file
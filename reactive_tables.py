@@ -0,0 +1,141 @@
+"""
+Purpose: Page and sort the continuous tables on the server.
+
+A table shows one page of rows at a time. Only that page is rendered to HTML
+and sent to the browser, however many rows the selection has. Sorting is
+done on the server too: page() finds the rows of the requested page with
+np.partition, in time linear in the number of rows, and sorts only those
+(and the rows tied with them, which rank by position as in a stable sort). A page's rows, summary and HTML are built once and shared, through
+a RenderCache, by every session showing that page of the same data version
+and selection. Sessions keep the last page sent and skip sending it again
+when a new tick leaves it unchanged (see reactive_server).
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+from shiny import reactive
+
+from util_config import get_setting
+from util_metrics import timed
+
+PAGE_SIZE = get_setting("CINTEL_TABLE_PAGE_SIZE", 20, int)
+
+PAGE_SIZES = (10, 20, 50, 100)
+
+ORDERS = {"desc": "Descending", "asc": "Ascending"}
+
+
+def sort_keys(series, descending=False):
+    """Return a numeric array that sorts like series, missing values last."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        labels = series.cat.categories.astype(str).to_numpy()
+        ranks = np.empty(len(labels), dtype=np.int64)
+        ranks[np.argsort(labels, kind="stable")] = np.arange(len(labels))
+        codes = series.cat.codes.to_numpy()
+        keys = np.where(codes >= 0, ranks[codes], len(labels)).astype(np.float64)
+        missing = codes < 0
+    else:
+        values = series.to_numpy()
+        if values.dtype.kind == "M":
+            missing = np.isnat(values)
+            keys = values.view(np.int64).astype(np.float64)
+        else:
+            keys = values.astype(np.float64)
+            missing = np.isnan(keys)
+    if descending:
+        keys = -keys
+    return np.where(missing, np.inf, keys)
+
+
+def window(keys, start, stop):
+    """Return the positions of the rows ranked start to stop - 1 by keys, in order.
+
+    Rows with equal keys rank by position, as in a stable sort, so every row
+    is on exactly one page. Only the rows whose keys fall between the page's
+    first and last key are sorted.
+    """
+    n = len(keys)
+    stop = min(stop, n)
+    if start >= stop:
+        return np.array([], dtype=np.int64)
+    if stop - start < n:
+        ranked = np.partition(keys, (start, stop - 1))
+        low, high = ranked[start], ranked[stop - 1]
+        candidates = np.flatnonzero((keys >= low) & (keys <= high))
+        offset = start - np.count_nonzero(keys < low)
+    else:
+        candidates = np.arange(n)
+        offset = 0
+    ordered = candidates[np.argsort(keys[candidates], kind="stable")]
+    return ordered[offset : offset + stop - start]
+
+
+def page(df, sort_by, descending, number, size):
+    """Return one page of df, sorted by the column sort_by.
+    @param number: the page, counting from 1; clamped to the pages there are.
+    @returns: (the page's rows, the page number, the number of pages).
+    """
+    pages = max(1, math.ceil(len(df) / size))
+    number = min(max(1, int(number or 1)), pages)
+    start = (number - 1) * size
+    if sort_by not in df.columns:
+        return df.iloc[start : start + size], number, pages
+    keys = sort_keys(df[sort_by], descending)
+    return df.iloc[window(keys, start, start + size)], number, pages
+
+
+def page_summary(number, pages, size, rows):
+    """Describe the page shown, e.g. "Rows 21-40 of 1,234 (page 2 of 62)"."""
+    if rows == 0:
+        return "No rows"
+    first = (number - 1) * size + 1
+    last = min(number * size, rows)
+    return f"Rows {first:,}-{last:,} of {rows:,} (page {number} of {pages})"
+
+
+def table_html(df):
+    """Return df as HTML, the way shiny's render.table would."""
+    return df.to_html(index=False, classes="table shiny-table w-auto", border=0)
+
+
+def render_page(df, sort_by, descending, number, size):
+    """Return (the HTML of one page of df, its summary); see page()."""
+    rows, number, pages = page(df, sort_by, descending, number, size)
+    return table_html(rows), page_summary(number, pages, size, len(df))
+
+
+def visible_page(input, prefix, get_rows, view, cache, source):
+    """Keep the page of get_rows() chosen by a session's table inputs.
+
+    The inputs are prefix + "_SORT", "_ORDER", "_SIZE" and "_PAGE" (see
+    reactive_ui_outputs.get_table_controls).
+    @param get_rows: a Calc returning the rows to page through.
+    @param view: a Calc returning a hashable that is equal whenever
+    get_rows() is, e.g. (data version, sorted selection).
+    @param cache: the RenderCache shared by sessions.
+    @returns: (html, summary), two reactive.Values that are only set when
+    the page shown or its summary changes, so unchanged pages are not sent.
+    """
+    html_value = reactive.Value(None)
+    summary_value = reactive.Value("")
+
+    @reactive.Effect
+    @timed("page", source=source)
+    def _():
+        sort_by = input[f"{prefix}_SORT"]()
+        descending = input[f"{prefix}_ORDER"]() == "desc"
+        number = input[f"{prefix}_PAGE"]()
+        size = int(input[f"{prefix}_SIZE"]() or PAGE_SIZE)
+        html, summary = cache.get(
+            (source, "page", view(), sort_by, descending, number, size),
+            lambda: render_page(get_rows(), sort_by, descending, number, size),
+        )
+        with reactive.isolate():
+            if html != html_value.get():
+                html_value.set(html)
+            if summary != summary_value.get():
+                summary_value.set(summary)
+
+    return html_value, summary_value
@@ -4,6 +4,8 @@ Purpose: Provide user interaction options for Reactive dataset.
 """
 from shiny import ui
 
+from util_entities import entities
+
 # Define the UI inputs and include our new selection options
 
 def get_reactive_inputs():
@@ -12,29 +14,21 @@ def get_reactive_inputs():
         ui.h4("Please select your options from below"),
         ui.tags.hr(),
         
-        ui.input_select(
+        # Only the default selections are sent with the page; the server
+        # fills in the full registry (util_entities) and searches it.
+        ui.input_selectize(
             id="REACTIVE_LOCATION_SELECT",
-            label="Choose your location(s) (hold CTRL to select multiple)",
-            choices=["Seattle WA",
-                "Portland OR", 
-                "San Francisco CA", 
-                "San Diego CA", 
-                "Phoenix AZ"
-                ],
-            selected="San Diego CA",
+            label="Choose your location(s) (type to search)",
+            choices=entities.locations.choices(entities.locations.selected),
+            selected=entities.locations.selected,
             multiple=True,
         ),
-        ui.input_select(
+        ui.input_selectize(
             id="REACTIVE_STOCK_SELECT",
-            label="Choose your stock(s) (hold CTRL to select multiple)",
-            choices=["Nordstrom Inc",
-                "Lululemon Athletica Inc",
-                "Starbucks Corporation",
-                "NIKE Inc",
-                "Amazon.com Inc",
-                ],
-            selected = "Nordstrom Inc",
-            multiple=True
+            label="Choose your stock(s) (type to search)",
+            choices=entities.companies.choices(entities.companies.selected),
+            selected=entities.companies.selected,
+            multiple=True,
         ),
         ui.tags.hr(),
         ui.tags.hr(),
@@ -7,6 +7,26 @@ Purpose: Display output for Reactive datasets.
 from shiny import ui
 from shinywidgets import output_widget
 
+from continuous_location import COLUMNS as LOCATION_COLUMNS
+from continuous_stock import COLUMNS as STOCK_COLUMNS
+from reactive_tables import ORDERS, PAGE_SIZE, PAGE_SIZES
+
+
+def get_table_controls(prefix, columns):
+    """Sort, order, page size and page inputs for one paged table."""
+    sizes = sorted({*PAGE_SIZES, PAGE_SIZE})
+    return ui.row(
+        ui.column(3, ui.input_select(f"{prefix}_SORT", "Sort by", list(columns), selected="Time")),
+        ui.column(3, ui.input_select(f"{prefix}_ORDER", "Order", ORDERS, selected="desc")),
+        ui.column(
+            3,
+            ui.input_select(
+                f"{prefix}_SIZE", "Rows per page", [str(n) for n in sizes], selected=str(PAGE_SIZE)
+            ),
+        ),
+        ui.column(3, ui.input_numeric(f"{prefix}_PAGE", "Page", value=1, min=1)),
+    )
+
 
 def get_reactive_outputs():
     return ui.panel_main(
@@ -17,18 +37,26 @@ def get_reactive_outputs():
             ui.tags.br(),
             ui.output_text("reactive_location_string"),
             ui.tags.br(),
+            get_table_controls("REACTIVE_LOCATION_TABLE", LOCATION_COLUMNS),
+            ui.output_text("reactive_location_table_info"),
             ui.output_ui("reactive_location_table"),
             ui.tags.br(),
             output_widget("reactive_location_chart"),
             ui.tags.br(),
+            ui.output_ui("reactive_location_analytics"),
+            ui.tags.br(),
             ui.tags.hr(),
             ui.h3("Tracking stock changes with a stock API"),
             ui.tags.br(),
             ui.output_text("reactive_stock_string"),
             ui.tags.br(),
+            get_table_controls("REACTIVE_STOCK_TABLE", STOCK_COLUMNS),
+            ui.output_text("reactive_stock_table_info"),
             ui.output_ui("reactive_stock_table"),
             ui.tags.br(),
             output_widget("reactive_stock_chart"),
+            ui.tags.br(),
+            ui.output_ui("reactive_stock_analytics"),
             ui.tags.hr(),
         ),
     )   
\ No newline at end of file
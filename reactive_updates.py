@@ -0,0 +1,236 @@
+"""
+Purpose: Tell every session as soon as a shared store has new rows.
+
+CINTEL_UPDATE_MODE chooses how sessions learn that new data arrived:
+
+- "push" (the default): after each successful poll, the ingestion scheduler
+  notifies the source's shared reactive version. Every session's outputs
+  that read the store are invalidated and sent at once; nothing is checked
+  per session while idle.
+- "watch": for deployments where another process runs the ingestion
+  (python continuous_ingest.py) and writes data/. The storage backend's file
+  is watched with inotify (watchfiles); after a change, the store is read
+  again once for the process and sessions are notified as in "push".
+- "poll": each session checks the store's version every second.
+- "shared": for several worker processes serving one app, e.g.
+  uvicorn app:app --workers 4. The workers elect a leader with a file lock
+  (util_leader). The leader polls, writes data/ and pushes to its sessions;
+  the others watch data/ as in "watch", and one of them takes over if the
+  leader exits. Use the mmap storage backend to share the data through
+  memory-mapped files.
+
+Session code reads a store through a Calc decorated with
+updates.reader(name), whatever the mode.
+"""
+
+import asyncio
+import functools
+from pathlib import Path
+
+from shiny import reactive
+
+from util_config import get_setting
+from util_leader import LeaderLock
+from util_logger import setup_logger
+from util_metrics import leader, timer
+
+logger, logname = setup_logger(__name__)
+
+UPDATE_MODES = ("push", "watch", "poll", "shared")
+
+UPDATE_MODE = get_setting("CINTEL_UPDATE_MODE", "push")
+
+# How often each session checks the store versions in "poll" mode.
+POLL_SECONDS = 1
+
+# Milliseconds without further changes before a file change is handled.
+WATCH_STEP_MS = 50
+
+# The lock held by the leader in "shared" mode, and how often others try it.
+LEADER_LOCK = get_setting(
+    "CINTEL_LEADER_LOCK", Path(__file__).parent.joinpath("data").joinpath("leader.lock")
+)
+ELECTION_SECONDS = 5
+
+
+class StoreSignal:
+    """The shared store of one source and the reactive version sessions depend on."""
+
+    def __init__(self, name, store, storage):
+        self.name = name
+        self.store = store
+        self.storage = storage
+        self.version = reactive.Value(store.version)
+        self.listeners = []  # called with the store before sessions are notified
+        self.task = None  # the file watcher, in "watch" mode
+
+
+class StoreUpdates:
+    """Process-wide notifier of store updates, one signal per source."""
+
+    def __init__(self, mode=UPDATE_MODE):
+        if mode not in UPDATE_MODES:
+            raise ValueError(f"Unknown update mode {mode!r}; use one of {UPDATE_MODES}")
+        self.mode = mode
+        self._signals = {}
+        self._running = False
+        self._pending = {}  # source name -> scheduled notify task
+        self._lock = LeaderLock(LEADER_LOCK) if mode == "shared" else None
+        self._election = None
+        self._ingesting = False
+
+    @property
+    def ingests(self):
+        """Whether this process runs the ingestion itself."""
+        return self._ingesting
+
+    def add(self, name, store, storage):
+        """Register the store (and its storage backend) of a source."""
+        self._signals[name] = StoreSignal(name, store, storage)
+
+    def listen(self, name, callback):
+        """Call callback(store) whenever the named store has new rows, even
+        when no session is open. Not called in "poll" mode."""
+        self._signals[name].listeners.append(callback)
+
+    def reader(self, name):
+        """Decorate a session function that reads the named store.
+
+        The result is a Calc that reruns whenever the store has new rows.
+        """
+        signal = self._signals[name]
+        if self.mode == "poll":
+            return reactive.poll(lambda: signal.store.version, POLL_SECONDS)
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def read():
+                signal.version.get()
+                return fn()
+
+            return reactive.Calc(read)
+
+        return decorator
+
+    def publish(self, name, result=None):
+        """Schedule notify(name) without holding up the caller.
+
+        Subscribed to the scheduler, so it runs after every successful poll.
+        Updates that arrive while a notification is still waiting to run are
+        sent with it.
+        """
+        if self.mode == "poll" or name in self._pending:
+            return
+        self._pending[name] = asyncio.create_task(self.notify(name))
+
+    async def notify(self, name):
+        """Invalidate every session's readers of a store and send their outputs."""
+        signal = self._signals.get(name)
+        if signal is None or self.mode == "poll":
+            return
+        for callback in signal.listeners:
+            try:
+                callback(signal.store)
+            except Exception as e:
+                logger.error("ERROR in listener for %s: %s", name, e)
+        with timer("notify", source=name):
+            async with reactive.lock():
+                self._pending.pop(name, None)
+                if signal.version.set(signal.store.version):
+                    await reactive.flush()
+
+    def start(self, ingest=None):
+        """Start delivering updates. Safe to call more than once.
+        @param ingest: function that starts this process's pollers. It is
+        called now, unless another process polls ("watch" mode, or "shared"
+        mode until this process is elected).
+        """
+        if self._running:
+            return
+        self._running = True
+        if self.mode == "watch":
+            self._start_watching()
+        elif self.mode == "shared":
+            self._election = asyncio.create_task(self._elect(ingest))
+        else:
+            self._start_ingesting(ingest)
+
+    async def stop(self):
+        """Stop the file watchers and the election, and give up the leader lock."""
+        if not self._running:
+            return
+        self._running = False
+        if self._election is not None:
+            self._election.cancel()
+            await asyncio.gather(self._election, return_exceptions=True)
+            self._election = None
+        await self._stop_watching()
+        if self._lock is not None:
+            self._lock.release()
+        self._ingesting = False
+        leader.set(0)
+
+    def _start_ingesting(self, ingest):
+        self._ingesting = True
+        leader.set(1)
+        if ingest is not None:
+            ingest()
+
+    async def _elect(self, ingest):
+        if not self._lock.acquire():
+            logger.info(f"Following; another process holds {self._lock.path}")
+            self._start_watching()
+            while not self._lock.acquire():
+                await asyncio.sleep(ELECTION_SECONDS)
+            await self._stop_watching()
+        logger.info("Elected to run the ingestion")
+        self._start_ingesting(ingest)
+
+    def _start_watching(self):
+        leader.set(0)
+        for signal in self._signals.values():
+            if signal.storage.watch_path is None:
+                logger.warning(
+                    f"The {signal.storage.name} backend of {signal.name} has no file to watch"
+                )
+                continue
+            self._reload(signal)  # instead of the store's own loader
+            signal.task = asyncio.create_task(self._watch(signal))
+        logger.info(f"Watching the storage files of {list(self._signals)}")
+
+    async def _stop_watching(self):
+        tasks = [s.task for s in self._signals.values() if s.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for signal in self._signals.values():
+            signal.task = None
+
+    async def _watch(self, signal):
+        from watchfiles import awatch  # only needed in "watch" mode
+
+        path = Path(signal.storage.watch_path).resolve()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        target = str(path)
+        await self.notify(signal.name)
+        async for _ in awatch(
+            path.parent,
+            watch_filter=lambda change, changed: changed == target,
+            step=WATCH_STEP_MS,
+            recursive=False,
+        ):
+            if self._reload(signal):
+                await self.notify(signal.name)
+
+    def _reload(self, signal):
+        try:
+            with timer("parse", source=signal.name):
+                signal.store.replace_frame(signal.storage.read())
+        except Exception as e:
+            logger.error("ERROR reading %s: %s", signal.storage.watch_path, e)
+            return False
+        return True
+
+
+# The one notifier for this process.
+updates = StoreUpdates()
@@ -0,0 +1,52 @@
+import asyncio
+from urllib.parse import urlsplit
+
+import continuous_stock
+import fetch
+from benchmarks.stub_server import api_payload
+from continuous_scheduler import IngestionScheduler
+from continuous_storage import NoBackend
+from continuous_store import TimeSeriesStore
+from fetch import HttpResponse, RateLimitedError
+from util_cache import NewReadings
+
+
+class Upstream:
+    """Answer every request from the stub's payloads, or with a status."""
+
+    def __init__(self):
+        self.status = 200
+        self.requests = 0
+
+    async def fetch(self, url, type, fetch_live):
+        self.requests += 1
+        if self.status != 200:
+            return HttpResponse(self.status, {}, retry_after=30)
+        url = urlsplit(url)
+        return HttpResponse(200, api_payload(f"{url.path}?{url.query}"))
+
+
+def test_rate_limit_backs_off_while_stale_prices_exist(monkeypatch):
+    upstream = Upstream()
+    columns = continuous_stock.COLUMNS
+    monkeypatch.setattr(fetch, "_tap", upstream)
+    monkeypatch.setattr(continuous_stock, "storage", NoBackend(None, columns, 10))
+    monkeypatch.setattr(continuous_stock, "store", TimeSeriesStore(columns, capacity=100))
+    monkeypatch.setattr(continuous_stock, "new_readings", NewReadings(continuous_stock.stock_cache))
+    monkeypatch.setattr(continuous_stock.stock_cache, "ttl", 0.0)  # every poll refreshes
+    continuous_stock.stock_cache.clear()
+
+    async def run():
+        scheduler = IngestionScheduler()
+        scheduler.add_source("stock", continuous_stock.update_csv_stock, interval=60)
+        assert await scheduler.poll_now("stock")
+        upstream.status = 429
+        assert await scheduler.poll_now("stock") is None  # the prices are only stale
+        return scheduler._sources["stock"], asyncio.get_running_loop().time()
+
+    source, now = asyncio.run(run())
+    assert isinstance(source.last_error, RateLimitedError)
+    assert source.errors == 1
+    assert source.backoff == 2
+    assert source.resume_at is not None and source.resume_at > now + 25
+    continuous_stock.stock_cache.clear()
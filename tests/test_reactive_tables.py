@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from reactive_tables import page, sort_keys, window
+
+
+def test_pages_of_tied_keys_concatenate_to_the_stable_sort():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        n = int(rng.integers(1, 300))
+        keys = rng.integers(0, max(1, n // 10), n).astype(np.float64)
+        size = int(rng.integers(1, 40))
+        pages = [window(keys, start, start + size) for start in range(0, n, size)]
+        expected = np.argsort(keys, kind="stable")
+        np.testing.assert_array_equal(np.concatenate(pages), expected)
+
+
+def test_time_descending_pages_with_one_time_per_poll():
+    polls, entities, size = 30, 17, 20
+    df = pd.DataFrame(
+        {
+            "Location": [f"L{i}" for _ in range(polls) for i in range(entities)],
+            "Time": np.repeat(pd.date_range("2023-01-01", periods=polls, freq="min"), entities),
+        }
+    )
+    shown = pd.concat(
+        [page(df, "Time", True, number, size)[0] for number in range(1, 1 + -(-len(df) // size))]
+    )
+    order = np.argsort(sort_keys(df["Time"], descending=True), kind="stable")
+    pd.testing.assert_frame_equal(shown, df.iloc[order])
@@ -0,0 +1,309 @@
+"""
+Purpose: Cache upstream API responses for a short time.
+
+AsyncTTLCache sits in front of the per-source getters (weather, stock price):
+
+- A value is served from memory for ttl seconds, or for less if the
+  caller passes a max_age.
+- Concurrent callers asking for the same key share one request
+  (single-flight), so identical requests are never in flight twice.
+- For stale_ttl seconds after expiring, a value is still good as a fallback.
+  The cache starts a refresh and waits up to stale_timeout seconds for it; if
+  the upstream is slow or fails (e.g. rate limited), the stale value is
+  returned and the refresh carries on in the background. A failed refresh
+  is counted as an error, and failure() keeps its exception, so a poller
+  served a stale value can still tell the upstream is failing.
+- At most max_size keys are kept; the least recently used goes first.
+- get_many() looks up many keys and fetches all the missing ones with one
+  call, for upstreams that answer many keys per request.
+- fetched_at() tells when the value held for a key was fetched, so
+  NewReadings can keep a poll from storing one cached value twice.
+
+RenderCache is a plain bounded LRU for work that is synchronous and the same
+for every session, e.g. a table's HTML, keyed on the data version and the
+selection; entries are never stale, since a new version is a new key.
+
+Hit, miss, stale and coalesced counters are kept per cache; cache_stats()
+returns them for every cache, and /metrics exports them via util_metrics.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+
+from util_logger import setup_logger
+from util_metrics import Counter, Gauge, collectors
+
+logger, log_filename = setup_logger(__file__)
+
+# Every cache created, by name, for cache_stats().
+caches = {}
+
+cache_events = Counter("cintel_cache_events_total", "Cache lookups by outcome.")
+cache_size = Gauge("cintel_cache_size", "Entries held per cache.")
+
+
+class CacheEntry:
+    __slots__ = ("value", "fetched", "expires", "stale_until")
+
+    def __init__(self, value, fetched, expires, stale_until):
+        self.value = value
+        self.fetched = fetched
+        self.expires = expires
+        self.stale_until = stale_until
+
+
+class AsyncTTLCache:
+    """Bounded LRU cache of async results with TTL and single-flight refreshes."""
+
+    def __init__(self, name, ttl, max_size=1024, stale_ttl=0.0, stale_timeout=2.0):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.stale_ttl = stale_ttl
+        self.stale_timeout = stale_timeout
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._failures = {}  # key -> exception of its last refresh, if it failed
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "coalesced": 0,
+            "errors": 0,
+        }
+        caches[name] = self
+
+    async def get(self, key, fetch, max_age=None):
+        """Return the value for key, calling fetch() (an async function) if needed.
+        @param max_age: refetch a value older than this many seconds, even
+        if it has not expired yet.
+        """
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if self._fresh(entry, now, max_age):
+            return self._hit(key, entry)
+        return await self._wait(key, entry, self._refresh(key, fetch), now)
+
+    async def get_many(self, keys, fetch_many, max_age=None):
+        """Return the values for many keys, fetching all the missing ones at once.
+        @param fetch_many: an async function taking a list of keys and returning
+        {key: value}; keys it leaves out count as failed.
+        @param max_age: as for get().
+        @returns: ({key: value}, {key: exception}), both in the order of keys.
+        """
+        keys = list(dict.fromkeys(keys))
+        now = time.monotonic()
+        missing = [
+            key
+            for key in keys
+            if key not in self._in_flight
+            and not self._fresh(self._entries.get(key), now, max_age)
+        ]
+        batch = None
+        if missing:
+            batch = asyncio.ensure_future(fetch_many(missing))
+            batch.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        values = {}
+        waits = {}
+        for key in keys:
+            entry = self._entries.get(key)
+            if self._fresh(entry, now, max_age):
+                values[key] = self._hit(key, entry)
+            else:
+                refresh = self._refresh(key, lambda key=key: _pick(batch, key))
+                waits[key] = self._wait(key, entry, refresh, now)
+
+        errors = {}
+        outcomes = await asyncio.gather(*waits.values(), return_exceptions=True)
+        for key, outcome in zip(waits, outcomes):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            if isinstance(outcome, Exception):
+                errors[key] = outcome
+            else:
+                values[key] = outcome
+        return {key: values[key] for key in keys if key in values}, errors
+
+    @staticmethod
+    def _fresh(entry, now, max_age):
+        if entry is None or now >= entry.expires:
+            return False
+        return max_age is None or now - entry.fetched < max_age
+
+    def _hit(self, key, entry):
+        self._entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return entry.value
+
+    async def _wait(self, key, entry, refresh, now):
+        """Await a refresh, or fall back to the stale entry if it is still usable."""
+        usable_stale = entry is not None and now < entry.stale_until
+        if not usable_stale:
+            self.counters["misses"] += 1
+            return await asyncio.shield(refresh)
+
+        try:
+            value = await asyncio.wait_for(asyncio.shield(refresh), self.stale_timeout)
+        except Exception as e:
+            # Slow (timeout) or failing upstream: serve the stale value. A
+            # failure was counted by the refresh and is kept for failure().
+            self.counters["stale"] += 1
+            if refresh.done():
+                logger.warning("Serving stale %s value for %s; refresh failed: %r", self.name, key, e)
+            else:
+                logger.info("Serving stale %s value for %s; refresh is slow", self.name, key)
+            return entry.value
+        self.counters["misses"] += 1
+        return value
+
+    def _refresh(self, key, fetch):
+        """Return the future of the one in-flight fetch for key, starting it if needed."""
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.counters["coalesced"] += 1
+            return future
+
+        async def run():
+            try:
+                value = await fetch()
+            except Exception as e:
+                self.counters["errors"] += 1
+                self._failures[key] = e
+                raise
+            finally:
+                self._in_flight.pop(key, None)
+            self._set(key, value)
+            return value
+
+        future = asyncio.ensure_future(run())
+        # A background refresh nobody waits for must not log "never retrieved".
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._in_flight[key] = future
+        return future
+
+    def _set(self, key, value):
+        now = time.monotonic()
+        expires = now + self.ttl
+        self._entries[key] = CacheEntry(value, now, expires, expires + self.stale_ttl)
+        self._failures.pop(key, None)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def failure(self, key):
+        """Return the exception of the last refresh of key if it failed (so any
+        value held for key is stale), or None."""
+        return self._failures.get(key)
+
+    def fetched_at(self, key):
+        """Return the time.monotonic() the value held for key was fetched, or None."""
+        entry = self._entries.get(key)
+        return None if entry is None else entry.fetched
+
+    def clear(self):
+        self._entries.clear()
+        self._failures.clear()
+
+    def stats(self):
+        """Return the counters and current size of this cache."""
+        return {**self.counters, "size": len(self._entries)}
+
+
+class NewReadings:
+    """Which cached value was last stored per entity, to store each one once.
+
+    Polls close together (e.g. of the entities sessions are viewing) can be
+    served the same cached value; storing it again would add a row that
+    repeats the last reading under a new time. A poll served only values it
+    already stored, because their refresh failed, has failed too.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+        self._stored = {}  # entity -> fetched time of the value stored last
+
+    def is_new(self, entity, key):
+        """Return True, and remember it as stored, if the value cached under key
+        was fetched after the last one stored for entity."""
+        fetched = self.cache.fetched_at(key)
+        if fetched is None:
+            return True
+        if entity in self._stored and fetched <= self._stored[entity]:
+            return False
+        self._stored[entity] = fetched
+        return True
+
+    def select(self, readings, key_of):
+        """Split {entity: value} into the readings not stored yet and the errors
+        of the rest whose refresh failed (so they were served stale).
+        @param key_of: returns the cache key of an entity.
+        @returns: ({entity: value}, {entity: exception}).
+        """
+        new = {}
+        failed = {}
+        for entity, value in readings.items():
+            key = key_of(entity)
+            if self.is_new(entity, key):
+                new[entity] = value
+            elif self.cache.failure(key) is not None:
+                failed[entity] = self.cache.failure(key)
+        return new, failed
+
+
+class RenderCache:
+    """Bounded LRU cache of values built synchronously, shared across sessions."""
+
+    def __init__(self, name, max_size=256):
+        self.name = name
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0}
+        caches[name] = self
+
+    def get(self, key, build):
+        """Return the value for key (a hashable), calling build() if it is not held."""
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.counters["misses"] += 1
+            value = self._entries[key] = build()
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            return value
+        self._entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """Return the counters and current size of this cache."""
+        return {**self.counters, "size": len(self._entries)}
+
+
+async def _pick(batch, key):
+    """Return the value for key from the result of a shared get_many() fetch."""
+    results = await asyncio.shield(batch)
+    if key not in results:
+        raise LookupError(f"No value returned for {key}")
+    return results[key]
+
+
+def cache_stats():
+    """Return stats() for every cache, by name."""
+    return {name: cache.stats() for name, cache in caches.items()}
+
+
+def collect_cache_metrics():
+    for name, stats in cache_stats().items():
+        for event, count in stats.items():
+            if event == "size":
+                cache_size.set(count, cache=name)
+            else:
+                cache_events.set(count, cache=name, event=event)
+
+
+collectors.append(collect_cache_metrics)
@@ -0,0 +1,34 @@
+"""
+Purpose: Read dashboard settings from the environment once and reuse them.
+
+Settings come from environment variables, or from a .env file in the
+working directory. The .env file is read once per process, the first time any
+setting is requested.
+"""
+
+import os
+
+from dotenv import load_dotenv
+
+_env_loaded = False
+
+
+def get_setting(name, default=None, cast=str):
+    """Return the setting called name, converted with cast, or the default.
+    @param name: the environment variable, e.g. "CINTEL_STOCK_INTERVAL".
+    @param default: returned when the variable is not set.
+    @param cast: a callable that converts the string value, e.g. int or float.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return cast(value)
+
+
+def as_bool(value):
+    """Convert a setting such as "1", "true" or "yes" to a bool."""
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
@@ -0,0 +1,117 @@
+"""
+Purpose: Reduce a long time series to a bounded number of points for charts.
+
+A browser cannot usefully draw more points than it has pixels, so the charts
+send at most max_points per line, whatever the retained history. Three
+methods are offered:
+
+- "lttb": Largest-Triangle-Three-Buckets keeps the points that best preserve
+  the visual shape of the line.
+- "minmax": keeps the lowest and highest point of each bucket, so spikes are
+  never hidden.
+- "ohlc": resamples prices into equal time buckets with open, high, low and
+  close values; the line follows the close.
+"""
+
+import numpy as np
+import pandas as pd
+
+METHODS = ("lttb", "minmax", "ohlc")
+
+
+def lttb_indices(x, y, max_points):
+    """Return the indices of the points kept by Largest-Triangle-Three-Buckets.
+    @param x: increasing numeric x values (NumPy array).
+    @param y: y values, the same length as x.
+    @param max_points: the number of points to keep (at least 3).
+    """
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    indices = np.empty(max_points, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    bucket_size = (n - 2) / (max_points - 2)
+
+    a = 0  # the point kept from the previous bucket
+    for i in range(max_points - 2):
+        # Average of the next bucket (the last bucket averages the last point).
+        next_start = int((i + 1) * bucket_size) + 1
+        next_end = min(int((i + 2) * bucket_size) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Keep the point of this bucket forming the largest triangle.
+        start = int(i * bucket_size) + 1
+        end = int((i + 1) * bucket_size) + 1
+        areas = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
+
+
+def minmax_indices(y, max_points):
+    """Return the indices of the lowest and highest point of each bucket."""
+    n = len(y)
+    if max_points >= n or max_points < 2:
+        return np.arange(n)
+    edges = np.linspace(0, n, max_points // 2 + 1).astype(np.int64)
+    keep = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            bucket = y[start:end]
+            keep.append(start + int(np.argmin(bucket)))
+            keep.append(start + int(np.argmax(bucket)))
+    return np.unique(keep)
+
+
+def ohlc_resample(df, x_column, y_column, max_points):
+    """Return open/high/low/close per time bucket, at most max_points buckets.
+
+    The result keeps x_column (the bucket start) and sets y_column to the close.
+    """
+    start, end = df[x_column].iloc[0], df[x_column].iloc[-1]
+    bucket = max((end - start) / max_points, pd.Timedelta(seconds=1))
+    bars = df.set_index(x_column)[y_column].resample(bucket).ohlc().dropna()
+    bars[y_column] = bars["close"]
+    return bars.reset_index()
+
+
+def downsample(df, x_column, y_column, max_points, method="lttb", x_range=None):
+    """Return the rows of one series to draw, at most about max_points of them.
+    @param df: the rows of one entity, sorted by x_column.
+    @param x_range: optional (start, end) of the visible x axis; rows outside
+    it are dropped first, so zooming in shows more detail.
+    """
+    if x_range is not None:
+        start, end = pd.Timestamp(x_range[0]), pd.Timestamp(x_range[1])
+        x = df[x_column]
+        df = df[(x >= start) & (x <= end)]
+    if max_points is None or len(df) <= max_points:
+        return df
+    if method == "ohlc":
+        return ohlc_resample(df, x_column, y_column, max_points)
+    if method == "minmax":
+        keep = minmax_indices(df[y_column].to_numpy(), max_points)
+    else:
+        x = df[x_column].to_numpy().astype("datetime64[ns]").astype(np.int64)
+        keep = lttb_indices(x, df[y_column].to_numpy(), max_points)
+    return df.iloc[keep]
+
+
+def downsample_groups(df, entity_column, x_column, y_column, max_points, method="lttb"):
+    """Return df with each entity reduced to at most about max_points rows."""
+    if max_points is None or len(df) <= max_points:
+        return df
+    parts = [
+        downsample(group, x_column, y_column, max_points, method)
+        .assign(**{entity_column: name})
+        for name, group in df.groupby(entity_column, observed=True)
+    ]
+    return pd.concat(parts, ignore_index=True)
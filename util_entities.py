@@ -0,0 +1,151 @@
+"""
+Purpose: Keep the tracked locations and companies in one registry.
+
+The entities are read once per process from a JSON file (data/entities.json,
+or the file named by CINTEL_ENTITIES_FILE) and shared by everything that
+needs them:
+
+- the pollers fetch every entity in the registry,
+- the inputs offer the registry's names (searched on the server, so
+  thousands of entities do not have to be sent to every browser),
+- selections coming back from the browser are validated against it,
+- optional alert_low / alert_high limits feed the alerts of
+  continuous_analytics.
+
+Lookups by name are dictionary lookups.
+"""
+
+import json
+from pathlib import Path
+
+from util_config import get_setting
+from util_logger import setup_logger
+
+logger, log_filename = setup_logger(__file__)
+
+DEFAULT_PATH = Path(__file__).parent.joinpath("data").joinpath("entities.json")
+
+
+class Location:
+    __slots__ = ("name", "latitude", "longitude", "city_id", "alert_low", "alert_high")
+
+    def __init__(
+        self, name, latitude, longitude, city_id=None, alert_low=None, alert_high=None
+    ):
+        latitude, longitude = float(latitude), float(longitude)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError(f"Invalid coordinates for {name}: {latitude}, {longitude}")
+        self.name = name
+        self.latitude = latitude
+        self.longitude = longitude
+        self.city_id = int(city_id) if city_id is not None else None  # OpenWeatherMap id
+        self.alert_low = alert_low  # alert when Temp_F falls below
+        self.alert_high = alert_high  # alert when Temp_F rises above
+
+    @property
+    def label(self):
+        return self.name
+
+
+class Company:
+    __slots__ = ("name", "ticker", "alert_low", "alert_high")
+
+    def __init__(self, name, ticker, alert_low=None, alert_high=None):
+        if not ticker:
+            raise ValueError(f"Missing ticker for {name}")
+        self.name = name
+        self.ticker = ticker.upper()
+        self.alert_low = alert_low  # alert when Price falls below
+        self.alert_high = alert_high  # alert when Price rises above
+
+    @property
+    def label(self):
+        return f"{self.name} ({self.ticker})"
+
+
+class EntityRegistry:
+    """The entities of one kind, in file order, indexed by name."""
+
+    def __init__(self, entities, selected=None):
+        self._by_name = {}
+        for entity in entities:
+            if entity.name in self._by_name:
+                raise ValueError(f"Duplicate entity {entity.name}")
+            self._by_name[entity.name] = entity
+        self.names = list(self._by_name)
+        self.selected = [name for name in selected or self.names[:1] if name in self]
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def __contains__(self, name):
+        return name in self._by_name
+
+    def __iter__(self):
+        return iter(self._by_name.values())
+
+    def __getitem__(self, name):
+        return self._by_name[name]
+
+    def choices(self, names=None):
+        """Return {name: label} for a selectize input.
+        @param names: only these entities; defaults to all of them.
+        """
+        if names is None:
+            names = self.names
+        return {name: self._by_name[name].label for name in names}
+
+    def thresholds(self):
+        """Return {name: (alert_low, alert_high)} for entities with either limit."""
+        return {
+            entity.name: (entity.alert_low, entity.alert_high)
+            for entity in self
+            if entity.alert_low is not None or entity.alert_high is not None
+        }
+
+    def validate(self, names):
+        """Return the known names among names, in order; unknown ones are dropped."""
+        if isinstance(names, str):
+            names = [names]
+        known = [name for name in names or () if name in self._by_name]
+        if len(known) != len(names or ()):
+            logger.warning("Ignoring unknown entities: %s", set(names) - set(known))
+        return known
+
+
+class Entities:
+    """Every tracked entity, by kind."""
+
+    def __init__(self, locations, companies):
+        self.locations = locations
+        self.companies = companies
+
+
+def load_entities(path=None):
+    """Read the entity registry from a JSON file.
+    @param path: the file; defaults to CINTEL_ENTITIES_FILE or data/entities.json.
+    """
+    path = Path(path or get_setting("CINTEL_ENTITIES_FILE", DEFAULT_PATH))
+    with open(path, encoding="utf-8") as file:
+        config = json.load(file)
+    locations = config["locations"]
+    companies = config["companies"]
+    entities = Entities(
+        EntityRegistry(
+            [Location(**entry) for entry in locations["entities"]],
+            locations.get("selected"),
+        ),
+        EntityRegistry(
+            [Company(**entry) for entry in companies["entities"]],
+            companies.get("selected"),
+        ),
+    )
+    logger.info(
+        f"Loaded {len(entities.locations)} locations and "
+        f"{len(entities.companies)} companies from {path}"
+    )
+    return entities
+
+
+# The one registry for this process.
+entities = load_entities()
@@ -0,0 +1,66 @@
+"""
+Purpose: Elect one leader among the processes that share the data directory.
+
+The leader holds an exclusive lock on a file (data/leader.lock by default)
+for as long as it runs. The operating system releases the lock when the
+process exits, however it exits, so any other process that keeps trying
+takes over. The lock file holds the leader's process id, for information.
+"""
+
+import os
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from util_logger import setup_logger
+
+logger, log_filename = setup_logger(__file__)
+
+
+class LeaderLock:
+    """A non-blocking, process-wide exclusive lock on one file."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        """Try once to become the leader, without waiting.
+        @returns: True if this process holds the lock (now or already).
+        """
+        if self._fd is not None:
+            return True
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode("utf-8"))
+        self._fd = fd
+        logger.info(f"Process {os.getpid()} holds {self.path}")
+        return True
+
+    def release(self):
+        """Give up the lock, if held, so another process can take over."""
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        if fcntl is None:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        os.close(fd)  # closing the descriptor also releases a flock
+        logger.info(f"Process {os.getpid()} released {self.path}")
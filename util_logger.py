@@ -10,13 +10,27 @@ You're also welcome to use it as a template for your own logging.
 
 """
 
+import atexit
+import functools
 import logging
+import logging.handlers
 import pathlib
 import platform
+import queue
 import sys
 import os
 import datetime
 
+# Loggers already set up, by module name, so setup_logger is idempotent.
+_loggers = {}
+
+# Queue mode: one queue and one background listener thread per process.
+# Handlers attached to loggers only enqueue records; the listener formats them
+# and does the file and console I/O off the event loop thread.
+_log_queue = None
+_listener = None
+_routing_handler = None
+
 
 def get_source_directory_path(current_file):
     """Returns the absolute path to this source directory."""
@@ -24,22 +38,100 @@ def get_source_directory_path(current_file):
     return dir
 
 
-def setup_logger(current_file):
+def _get_setting(name, default):
+    """Read a logging setting from the environment (util_logger must not import
+    other project modules, so it does not use util_config)."""
+    return os.getenv(name) or default
+
+
+def _use_queue():
+    return _get_setting("CINTEL_LOG_QUEUE", "true").strip().lower() in ("1", "true", "yes", "on")
+
+
+class _RoutingHandler(logging.Handler):
+    """Runs in the listener thread; sends each record to its module's handlers."""
+
+    def __init__(self):
+        super().__init__()
+        self.handlers_by_name = {}
+
+    def emit(self, record):
+        for handler in self.handlers_by_name.get(record.name, ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records unformatted; the listener thread does the formatting."""
+
+    def prepare(self, record):
+        return record
+
+
+def _start_listener():
+    global _log_queue, _listener, _routing_handler
+    if _listener is None:
+        _log_queue = queue.SimpleQueue()
+        _routing_handler = _RoutingHandler()
+        _listener = logging.handlers.QueueListener(_log_queue, _routing_handler)
+        _listener.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread (safe to call twice)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+@functools.lru_cache(maxsize=None)
+def _banner_lines():
+    """The environment details written at the top of every log, probed once."""
+    divider_string = "============================================================="
+    return (
+        divider_string,
+        f"Today is {datetime.date.today()} at {datetime.datetime.now().strftime('%I:%M %p')}",
+        f"This file is running on: {os.name} {platform.system()} {platform.release()}",
+        f"The Python version is: {platform.python_version()}",
+        f"The active environment path is:   {sys.prefix}",
+        f"The current working directory is: {os.getcwd()}",
+        divider_string,
+    )
+
+
+def setup_logger(current_file, use_queue=None):
     """Setup a logger to automatically log useful information.
     @param current_file: the name of the file requesting a logger.
+    @param use_queue: hand records to a background thread; defaults to the
+    CINTEL_LOG_QUEUE setting (on unless set to false).
     @returns: the logger object and the name of the logfile.
+
+    Calling this again for the same module returns the same logger without
+    adding handlers. Log files are appended to and rotated by size
+    (CINTEL_LOG_MAX_BYTES, CINTEL_LOG_BACKUPS) rather than truncated.
     """
+    module_name = pathlib.Path(current_file).stem
+    if module_name in _loggers:
+        return _loggers[module_name]
+
     logs_dir = pathlib.Path("logs")
     logs_dir.mkdir(exist_ok=True)
 
-    module_name = pathlib.Path(current_file).stem
     log_file_name = logs_dir.joinpath(module_name + ".log")
 
     logger = logging.getLogger(module_name)
     logger.setLevel(logging.DEBUG)  # Set the root logger level.
+    logger.propagate = False
 
     # Create file handler which logs even debug messages.
-    file_handler = logging.FileHandler(log_file_name, "w")
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file_name,
+        "a",
+        maxBytes=int(_get_setting("CINTEL_LOG_MAX_BYTES", 1_000_000)),
+        backupCount=int(_get_setting("CINTEL_LOG_BACKUPS", 3)),
+    )
     file_handler.setLevel(logging.DEBUG)
 
     # Create console handler with a higher log level.
@@ -51,24 +143,21 @@ def setup_logger(current_file):
     file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
 
-    # Add the handlers to the logger.
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
-
-    divider_string = "============================================================="
-    python_version_string = platform.python_version()
-    today = datetime.date.today()
-
-    logger.info(divider_string)
-    logger.info(f"Today is {today} at {datetime.datetime.now().strftime('%I:%M %p')}")
-    logger.info(
-        f"This file is running on: {os.name} {platform.system()} {platform.release()}"
-    )
-    logger.info(f"The Python version is: {python_version_string}")
-    logger.info(f"The active environment path is:   {sys.prefix}")
-    logger.info(f"The current working directory is: {os.getcwd()}")
-    logger.info(divider_string)
-
+    # Add the handlers to the logger, directly or behind the queue.
+    if use_queue is None:
+        use_queue = _use_queue()
+    if use_queue:
+        _start_listener()
+        _routing_handler.handlers_by_name[module_name] = [file_handler, console_handler]
+        logger.addHandler(_DeferredQueueHandler(_log_queue))
+    else:
+        logger.addHandler(file_handler)
+        logger.addHandler(console_handler)
+
+    for line in _banner_lines():
+        logger.info(line)
+
+    _loggers[module_name] = (logger, log_file_name)
     return logger, log_file_name
 
 
@@ -77,6 +166,7 @@ if __name__ == "__main__":
     logger.info("Starting util_logger.py")
     logger.info(f"Information is logged to: logs/{logname}")
     logger.info("Ending util_logger.py")
+    stop_logging()
 
     # Use built-in open() function to read log file and print it to the terminal
     with open(logname, "r") as file_wrapper:
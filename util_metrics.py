@@ -0,0 +1,195 @@
+"""
+Purpose: Measure the hot paths and expose the numbers in Prometheus text format.
+
+Counters, gauges and histograms are kept in one process-wide registry.
+The timed() decorator (or the timer() context manager) records how long a
+function (sync or async) takes in the cintel_stage_seconds histogram,
+labelled by stage (fetch, parse, write, filter, render, ...) and any extra
+labels. Errors raised while timing are counted in cintel_stage_errors_total.
+
+render_metrics() returns the text served at /metrics by app.py.
+"""
+
+import contextlib
+import functools
+import inspect
+import math
+import time
+
+# Histogram buckets in seconds, from 0.5 ms to 1 minute.
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+# Every metric, by name, in registration order.
+registry = {}
+
+# Functions called just before rendering, to refresh gauges computed on demand.
+collectors = []
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+class Counter:
+    """A value that only goes up, per set of labels."""
+
+    type = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        registry[name] = self
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Set the total directly, for counts kept elsewhere (e.g. caches)."""
+        self.values[_label_key(labels)] = value
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name, key, value
+
+
+class Gauge(Counter):
+    """A value that can go up and down, per set of labels."""
+
+    type = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Counts of observations per bucket, with their sum, per set of labels."""
+
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.values = {}  # label key -> [bucket counts..., +Inf count, sum]
+        registry[name] = self
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        counts = self.values.get(key)
+        if counts is None:
+            counts = self.values[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[len(self.buckets)] += 1
+        counts[-1] += value
+
+    def samples(self):
+        for key, counts in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = "+Inf" if bound == math.inf else repr(bound)
+                yield f"{self.name}_bucket", key + (("le", le),), cumulative
+            yield f"{self.name}_count", key, cumulative
+            yield f"{self.name}_sum", key, counts[-1]
+
+
+stage_seconds = Histogram(
+    "cintel_stage_seconds", "Time spent in each stage of ingestion and rendering."
+)
+stage_errors = Counter(
+    "cintel_stage_errors_total", "Exceptions raised in each stage."
+)
+source_polls = Counter(
+    "cintel_source_polls_total", "Successful polls per ingestion source."
+)
+source_errors = Counter(
+    "cintel_source_errors_total", "Failed polls per ingestion source."
+)
+source_skipped = Counter(
+    "cintel_source_skipped_total", "Polls skipped because the previous one was running."
+)
+cycle_lag = Histogram(
+    "cintel_cycle_lag_seconds", "How late each poll started after it was due."
+)
+cycle_overrun = Histogram(
+    "cintel_cycle_overrun_seconds", "How far each poll ran past its next deadline."
+)
+source_interval = Gauge(
+    "cintel_source_interval_seconds", "Seconds between polls per source, after backoff."
+)
+source_rate_limited = Counter(
+    "cintel_source_rate_limited_total", "Polls that failed because the upstream rate limited."
+)
+source_age = Gauge(
+    "cintel_source_age_seconds", "Seconds since the last successful poll per source."
+)
+active_sessions = Gauge("cintel_active_sessions", "Open browser sessions.")
+leader = Gauge("cintel_leader", "1 if this process runs the ingestion, else 0.")
+
+
+@contextlib.contextmanager
+def timer(stage, **labels):
+    """Record the duration of the with block under stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage=stage, **labels)
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage=stage, **labels)
+
+
+def timed(stage, **labels):
+    """Decorate a function (sync or async) to record its duration under stage."""
+
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with timer(stage, **labels):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with timer(stage, **labels):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def render_metrics():
+    """Return every metric in the Prometheus text exposition format."""
+    for collect in collectors:
+        collect()
+    lines = []
+    for metric in registry.values():
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for name, key, value in metric.samples():
+            lines.append(f"{name}{_format_labels(key)} {value}")
+    return "\n".join(lines) + "\n"